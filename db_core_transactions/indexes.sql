@@ -0,0 +1,24 @@
+-- Secondary indexes for the hot query paths of the ingest scripts.
+-- The set is versioned in schema_versions: when changing it, add the new
+-- statements below (keeping them idempotent) and bump the version, so the
+-- file can also be re-applied to an existing database with psql -f.
+-- Indexes on the partitioned tables cascade to every partition.
+CREATE TABLE IF NOT EXISTS schema_versions (
+    component VARCHAR(63) PRIMARY KEY,
+    version INTEGER NOT NULL,
+    applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Version 1
+-- Per-user history within a time range.
+CREATE INDEX IF NOT EXISTS transactions_mastercard_user_id_timestamp_idx ON transactions_mastercard (user_id, timestamp);
+CREATE INDEX IF NOT EXISTS transactions_paypal_user_id_timestamp_idx ON transactions_paypal (user_id, timestamp);
+CREATE INDEX IF NOT EXISTS transactions_internal_sender_id_timestamp_idx ON transactions_internal (sender_id, timestamp);
+CREATE INDEX IF NOT EXISTS transactions_internal_receiver_id_timestamp_idx ON transactions_internal (receiver_id, timestamp);
+
+-- Version 2
+-- Dashboards reading the rollups of every user over a range of days.
+CREATE INDEX IF NOT EXISTS user_daily_rollups_day_idx ON user_daily_rollups (day);
+
+INSERT INTO schema_versions (component, version) VALUES ('indexes', 2)
+ON CONFLICT (component) DO UPDATE SET version = EXCLUDED.version, applied_at = CURRENT_TIMESTAMP;
@@ -1,39 +1,262 @@
+-- Merchants, account types, statuses and transaction types repeat in every
+-- row, so they are enums: 4 bytes instead of the label's length, validated
+-- without the per-row trigger a foreign key to a lookup table would fire on
+-- every COPY. New values are added with ALTER TYPE ... ADD VALUE.
+DO $$ BEGIN
+    CREATE TYPE merchant AS ENUM ('Amazon', 'Walmart', 'BestBuy', 'Target', 'Starbucks');
+EXCEPTION WHEN duplicate_object THEN NULL;
+END $$;
+
+DO $$ BEGIN
+    CREATE TYPE account_type AS ENUM ('credit_card', 'prepago', 'savings', 'paypal');
+EXCEPTION WHEN duplicate_object THEN NULL;
+END $$;
+
+DO $$ BEGIN
+    CREATE TYPE transaction_status AS ENUM ('approved', 'declined', 'completed', 'pending');
+EXCEPTION WHEN duplicate_object THEN NULL;
+END $$;
+
+DO $$ BEGIN
+    CREATE TYPE transaction_type AS ENUM ('mastercard', 'paypal', 'internal_send', 'internal_receive');
+EXCEPTION WHEN duplicate_object THEN NULL;
+END $$;
+
+-- The transactions tables (and operations below) are range partitioned by
+-- month on timestamp, so time-bounded queries only scan the matching months
+-- and retention is a matter of dropping whole partitions. The partition key
+-- has to be part of the primary key. Partitions are named <table>_YYYY_MM and
+-- created by ensure_monthly_partitions().
 CREATE TABLE IF NOT EXISTS transactions_mastercard (
-    id SERIAL PRIMARY KEY,
+    id SERIAL,
     user_id INTEGER,
     amount DECIMAL(15,2),
-    merchant VARCHAR(255),
-    account_type VARCHAR(50),
-    timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-    status VARCHAR(50)
-);
+    merchant merchant,
+    account_type account_type,
+    timestamp TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    status transaction_status,
+    PRIMARY KEY (id, timestamp)
+) PARTITION BY RANGE (timestamp);
 
 CREATE TABLE IF NOT EXISTS transactions_paypal (
-    id SERIAL PRIMARY KEY,
+    id SERIAL,
     user_id INTEGER,
     amount DECIMAL(15,2),
-    merchant VARCHAR(255),
-    account_type VARCHAR(50),
-    timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-    status VARCHAR(50)
-);
+    merchant merchant,
+    account_type account_type,
+    timestamp TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    status transaction_status,
+    PRIMARY KEY (id, timestamp)
+) PARTITION BY RANGE (timestamp);
 
 CREATE TABLE IF NOT EXISTS transactions_internal (
-    id SERIAL PRIMARY KEY,
+    id SERIAL,
     sender_id INTEGER,
     receiver_id INTEGER,
     amount DECIMAL(15,2),
-    account_type VARCHAR(50),
-    timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-    status VARCHAR(50)
+    account_type account_type,
+    timestamp TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    status transaction_status,
+    PRIMARY KEY (id, timestamp)
+) PARTITION BY RANGE (timestamp);
+
+-- operations unifies the three transactions tables. It is a regular table
+-- kept up to date by refresh_operations() instead of a view over a UNION ALL,
+-- so ids are stable and per-user history is an index lookup. For internal
+-- transactions two rows are stored (with no merchant):
+--   - one for the sender (with negative amount)
+--   - one for the receiver (with positive amount)
+-- status is copied from the source row, so consumers can leave out declined
+-- payments and pending transfers.
+CREATE TABLE IF NOT EXISTS operations (
+    id BIGSERIAL,
+    user_id INTEGER,
+    amount DECIMAL(15,2),
+    transaction_type transaction_type,
+    merchant merchant,
+    line_id INTEGER,
+    timestamp TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    status transaction_status,
+    PRIMARY KEY (id, timestamp),
+    UNIQUE (transaction_type, line_id, timestamp)
+) PARTITION BY RANGE (timestamp);
+
+CREATE INDEX IF NOT EXISTS operations_user_id_timestamp_idx ON operations (user_id, timestamp);
+
+-- Highest source row id each derived table (consumer) has already absorbed.
+CREATE TABLE IF NOT EXISTS refresh_watermarks (
+    consumer VARCHAR(63),
+    source_table VARCHAR(63),
+    last_id BIGINT NOT NULL DEFAULT 0,
+    refreshed_at TIMESTAMP,
+    PRIMARY KEY (consumer, source_table)
+);
+
+-- Lock the consumer's watermark for source_table and advance it to the
+-- source's current max id. Returns the (low_id, high_id] range of rows the
+-- caller must process in the same transaction.
+CREATE OR REPLACE FUNCTION claim_watermark(p_consumer TEXT, p_source TEXT, OUT low_id BIGINT, OUT high_id BIGINT) AS $$
+BEGIN
+    INSERT INTO refresh_watermarks (consumer, source_table)
+    VALUES (p_consumer, p_source)
+    ON CONFLICT DO NOTHING;
+
+    SELECT last_id INTO low_id
+    FROM refresh_watermarks
+    WHERE consumer = p_consumer AND source_table = p_source
+    FOR UPDATE;
+
+    EXECUTE format('SELECT COALESCE(MAX(id), $1) FROM %I WHERE id > $1', p_source)
+    INTO high_id USING low_id;
+
+    UPDATE refresh_watermarks
+    SET last_id = high_id, refreshed_at = now()
+    WHERE consumer = p_consumer AND source_table = p_source;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Append the transactions inserted since the last refresh to operations and
+-- return the number of operations rows added. Writers are blocked by the
+-- SHARE lock until the refresh commits, so no row with an id below the new
+-- watermarks can still be in flight.
+CREATE OR REPLACE FUNCTION refresh_operations() RETURNS BIGINT AS $$
+DECLARE
+    w RECORD;
+    added BIGINT := 0;
+    n BIGINT;
+BEGIN
+    LOCK TABLE transactions_mastercard, transactions_paypal, transactions_internal IN SHARE MODE;
+
+    SELECT * INTO w FROM claim_watermark('operations', 'transactions_mastercard');
+    INSERT INTO operations (user_id, amount, transaction_type, merchant, line_id, timestamp, status)
+    SELECT user_id, amount, 'mastercard'::transaction_type, merchant, id, timestamp, status
+    FROM transactions_mastercard
+    WHERE id > w.low_id AND id <= w.high_id;
+    GET DIAGNOSTICS n = ROW_COUNT;
+    added := added + n;
+
+    SELECT * INTO w FROM claim_watermark('operations', 'transactions_paypal');
+    INSERT INTO operations (user_id, amount, transaction_type, merchant, line_id, timestamp, status)
+    SELECT user_id, amount, 'paypal'::transaction_type, merchant, id, timestamp, status
+    FROM transactions_paypal
+    WHERE id > w.low_id AND id <= w.high_id;
+    GET DIAGNOSTICS n = ROW_COUNT;
+    added := added + n;
+
+    SELECT * INTO w FROM claim_watermark('operations', 'transactions_internal');
+    INSERT INTO operations (user_id, amount, transaction_type, line_id, timestamp, status)
+    SELECT sender_id, -amount, 'internal_send'::transaction_type, id, timestamp, status
+    FROM transactions_internal
+    WHERE id > w.low_id AND id <= w.high_id
+    UNION ALL
+    SELECT receiver_id, amount, 'internal_receive'::transaction_type, id, timestamp, status
+    FROM transactions_internal
+    WHERE id > w.low_id AND id <= w.high_id;
+    GET DIAGNOSTICS n = ROW_COUNT;
+    added := added + n;
+
+    RETURN added;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Per user and day: number of settled (approved or completed) operations
+-- and their total amount by transaction type and merchant (NULL for
+-- internal transfers, whose amounts are signed, so the internal_send and
+-- internal_receive rows add up to the net internal flow). Declined payments
+-- and pending transfers are left out. Maintained from operations by
+-- refresh_user_daily_rollups(); rows outlive the operations partitions they
+-- were computed from.
+CREATE TABLE IF NOT EXISTS user_daily_rollups (
+    user_id INTEGER NOT NULL,
+    day DATE NOT NULL,
+    transaction_type transaction_type NOT NULL,
+    merchant merchant,
+    operations INTEGER NOT NULL,
+    amount DECIMAL(15,2) NOT NULL,
+    UNIQUE NULLS NOT DISTINCT (user_id, day, transaction_type, merchant)
 );
 
--- THE NEXT TABLE IS CREATED AS A VIEW
--- CREATE TABLE IF NOT EXISTS operations (
---     id SERIAL PRIMARY KEY,
---     user_id INTEGER,
---     amount DECIMAL(15,2),
---     transaction_type VARCHAR(50),
---     line_id INTEGER,
---     timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
--- );
\ No newline at end of file
+-- Fold the operations rows added since the last call into
+-- user_daily_rollups and return the number of rollup rows inserted or
+-- updated. Like refresh_operations(), the SHARE lock keeps rows with ids
+-- below the new watermark from still being in flight.
+CREATE OR REPLACE FUNCTION refresh_user_daily_rollups() RETURNS BIGINT AS $$
+DECLARE
+    w RECORD;
+    n BIGINT;
+BEGIN
+    LOCK TABLE operations IN SHARE MODE;
+
+    SELECT * INTO w FROM claim_watermark('user_daily_rollups', 'operations');
+    INSERT INTO user_daily_rollups AS r (user_id, day, transaction_type, merchant, operations, amount)
+    SELECT user_id, timestamp::date, transaction_type, merchant, count(*), sum(amount)
+    FROM operations
+    WHERE id > w.low_id AND id <= w.high_id
+      AND status IN ('approved', 'completed')
+    GROUP BY 1, 2, 3, 4
+    ON CONFLICT (user_id, day, transaction_type, merchant) DO UPDATE
+    SET operations = r.operations + EXCLUDED.operations,
+        amount = r.amount + EXCLUDED.amount;
+    GET DIAGNOSTICS n = ROW_COUNT;
+
+    RETURN n;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Create the missing monthly partitions covering [p_from, p_to] for every
+-- partitioned table and return how many were created. Loaders call it for
+-- their time window before writing; it is safe to call concurrently.
+CREATE OR REPLACE FUNCTION ensure_monthly_partitions(p_from TIMESTAMP, p_to TIMESTAMP) RETURNS INTEGER AS $$
+DECLARE
+    parent TEXT;
+    month DATE;
+    partition TEXT;
+    created INTEGER := 0;
+BEGIN
+    PERFORM pg_advisory_xact_lock(hashtext('ensure_monthly_partitions'));
+
+    FOREACH parent IN ARRAY ARRAY['transactions_mastercard', 'transactions_paypal', 'transactions_internal', 'operations'] LOOP
+        month := date_trunc('month', p_from)::date;
+        WHILE month <= p_to LOOP
+            partition := format('%s_%s', parent, to_char(month, 'YYYY_MM'));
+            IF to_regclass(partition) IS NULL THEN
+                EXECUTE format('CREATE TABLE %I PARTITION OF %I FOR VALUES FROM (%L) TO (%L)',
+                               partition, parent, month, (month + interval '1 month')::date);
+                created := created + 1;
+            END IF;
+            month := (month + interval '1 month')::date;
+        END LOOP;
+    END LOOP;
+
+    RETURN created;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Detach and drop every monthly partition that ends before the start of the
+-- month p_keep_months months ago, and return how many were dropped.
+CREATE OR REPLACE FUNCTION drop_old_partitions(p_keep_months INTEGER) RETURNS INTEGER AS $$
+DECLARE
+    cutoff DATE := (date_trunc('month', now()) - make_interval(months => p_keep_months))::date;
+    part RECORD;
+    dropped INTEGER := 0;
+BEGIN
+    FOR part IN
+        SELECT parent.relname AS parent_name, child.relname AS partition_name
+        FROM pg_inherits
+        JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+        JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+        WHERE parent.relname IN ('transactions_mastercard', 'transactions_paypal', 'transactions_internal', 'operations')
+          AND child.relname ~ '_[0-9]{4}_[0-9]{2}$'
+          AND to_date(right(child.relname, 7), 'YYYY_MM') < cutoff
+    LOOP
+        EXECUTE format('ALTER TABLE %I DETACH PARTITION %I', part.parent_name, part.partition_name);
+        EXECUTE format('DROP TABLE %I', part.partition_name);
+        dropped := dropped + 1;
+    END LOOP;
+
+    RETURN dropped;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Two years of history and the next three months.
+SELECT ensure_monthly_partitions((now() - interval '24 months')::timestamp, (now() + interval '3 months')::timestamp);
@@ -0,0 +1,24 @@
+-- Secondary indexes for the hot query paths of the ingest scripts.
+-- The set is versioned in schema_versions: when changing it, add the new
+-- statements below (keeping them idempotent) and bump the version, so the
+-- file can also be re-applied to an existing database with psql -f.
+CREATE TABLE IF NOT EXISTS schema_versions (
+    component VARCHAR(63) PRIMARY KEY,
+    version INTEGER NOT NULL,
+    applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Version 1
+-- Account lookups by type, optionally restricted to an id range (the
+-- transaction loader's partitions); user_id and activated_at are included
+-- so the loaders' scans are index-only.
+CREATE INDEX IF NOT EXISTS accounts_account_type_id_idx ON accounts (account_type, id) INCLUDE (user_id, activated_at);
+-- Foreign keys, used for per-user lookups and cascading truncates.
+CREATE INDEX IF NOT EXISTS accounts_user_id_idx ON accounts (user_id);
+CREATE INDEX IF NOT EXISTS demographics_user_id_idx ON demographics (user_id);
+CREATE INDEX IF NOT EXISTS onboarding_user_id_idx ON onboarding (user_id);
+CREATE INDEX IF NOT EXISTS user_status_user_id_idx ON user_status (user_id);
+CREATE INDEX IF NOT EXISTS card_info_account_id_idx ON card_info (account_id);
+
+INSERT INTO schema_versions (component, version) VALUES ('indexes', 1)
+ON CONFLICT (component) DO UPDATE SET version = EXCLUDED.version, applied_at = CURRENT_TIMESTAMP;
@@ -1,3 +1,34 @@
+-- Low-cardinality labels are stored compactly: account types as an enum
+-- (4 bytes, validated by the type itself) and locations as a SMALLINT
+-- reference to regions. Adding a value means ALTER TYPE ... ADD VALUE or a
+-- new regions row; the ids of the seeded regions are the positions (+ 1) of
+-- chile_locations in ingest_data/synthetic.py, which the loaders write.
+DO $$ BEGIN
+    CREATE TYPE account_type AS ENUM ('credit_card', 'prepago', 'savings', 'paypal');
+EXCEPTION WHEN duplicate_object THEN NULL;
+END $$;
+
+CREATE TABLE IF NOT EXISTS regions (
+    id SMALLINT PRIMARY KEY,
+    country VARCHAR(100) NOT NULL,
+    state VARCHAR(100) NOT NULL,
+    city VARCHAR(100) NOT NULL,
+    UNIQUE (country, state, city)
+);
+
+INSERT INTO regions (id, country, state, city) VALUES
+    (1, 'Chile', 'Región Metropolitana', 'Santiago'),
+    (2, 'Chile', 'Región de Valparaíso', 'Valparaíso'),
+    (3, 'Chile', 'Región del Biobío', 'Concepción'),
+    (4, 'Chile', 'Región de Coquimbo', 'La Serena'),
+    (5, 'Chile', 'Región de Antofagasta', 'Antofagasta'),
+    (6, 'Chile', 'Región de La Araucanía', 'Temuco'),
+    (7, 'Chile', 'Región de O''Higgins', 'Rancagua'),
+    (8, 'Chile', 'Región de Los Lagos', 'Puerto Montt'),
+    (9, 'Chile', 'Región de Magallanes', 'Punta Arenas'),
+    (10, 'Chile', 'Región de Tarapacá', 'Iquique')
+ON CONFLICT DO NOTHING;
+
 CREATE TABLE IF NOT EXISTS users (
     id SERIAL PRIMARY KEY,
     name VARCHAR(255),
@@ -13,9 +44,7 @@ CREATE TABLE IF NOT EXISTS demographics (
     age INTEGER,
     gender VARCHAR(50),
     income_level VARCHAR(50),
-    country VARCHAR(100),
-    state VARCHAR(100),
-    city VARCHAR(100)
+    region_id SMALLINT REFERENCES regions(id)
 );
 
 CREATE TABLE IF NOT EXISTS onboarding (
@@ -36,7 +65,7 @@ CREATE TABLE IF NOT EXISTS user_status (
 CREATE TABLE IF NOT EXISTS accounts (
     id SERIAL PRIMARY KEY,
     user_id INTEGER REFERENCES users(id),
-    account_type VARCHAR(50),
+    account_type account_type,
     balance DECIMAL(15,2),
     currency VARCHAR(10),
     activated_at TIMESTAMP
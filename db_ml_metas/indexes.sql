@@ -0,0 +1,24 @@
+-- Secondary indexes for the hot query paths of the ingest scripts.
+-- The set is versioned in schema_versions: when changing it, add the new
+-- statements below (keeping them idempotent) and bump the version, so the
+-- file can also be re-applied to an existing database with psql -f.
+CREATE TABLE IF NOT EXISTS schema_versions (
+    component VARCHAR(63) PRIMARY KEY,
+    version INTEGER NOT NULL,
+    applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Version 1
+-- A user is assigned to a campaign at most once.
+CREATE UNIQUE INDEX IF NOT EXISTS user_campaigns_user_id_campaign_id_idx ON user_campaigns (user_id, campaign_id);
+-- Foreign key, used for per-campaign lookups and cascading truncates.
+CREATE INDEX IF NOT EXISTS user_campaigns_campaign_id_idx ON user_campaigns (campaign_id);
+-- Campaigns active on a given date.
+CREATE INDEX IF NOT EXISTS campaigns_start_date_end_date_idx ON campaigns (start_date, end_date);
+
+-- Version 2
+-- Assignments listing a merchant (merchant_list @> ARRAY[...]).
+CREATE INDEX IF NOT EXISTS user_campaigns_merchant_list_idx ON user_campaigns USING GIN (merchant_list);
+
+INSERT INTO schema_versions (component, version) VALUES ('indexes', 2)
+ON CONFLICT (component) DO UPDATE SET version = EXCLUDED.version, applied_at = CURRENT_TIMESTAMP;
@@ -1,3 +1,10 @@
+-- Merchants as in db_core_transactions: an enum, so merchant_list stores
+-- 4 bytes per merchant instead of its name.
+DO $$ BEGIN
+    CREATE TYPE merchant AS ENUM ('Amazon', 'Walmart', 'BestBuy', 'Target', 'Starbucks');
+EXCEPTION WHEN duplicate_object THEN NULL;
+END $$;
+
 CREATE TABLE IF NOT EXISTS campaigns (
     id SERIAL PRIMARY KEY,
     name VARCHAR(255),
@@ -11,7 +18,23 @@ CREATE TABLE IF NOT EXISTS user_campaigns (
     id SERIAL PRIMARY KEY,
     user_id INTEGER,
     campaign_id INTEGER REFERENCES campaigns(id),
-    merchant_list TEXT[], 
+    merchant_list merchant[],
     start_date DATE,
     end_date DATE
-);
\ No newline at end of file
+);
+
+-- Cashback earned on each assignment, recomputed by ingest_data/cashback.py
+-- from the operations in db_core_transactions: the spend at the listed
+-- merchants between the campaign dates, cashback_percentage of it, and the
+-- spend as a fraction of the campaign goal. Truncating campaigns (CASCADE)
+-- clears it along with user_campaigns.
+CREATE TABLE IF NOT EXISTS user_campaign_cashback (
+    user_id INTEGER,
+    campaign_id INTEGER REFERENCES campaigns(id),
+    operations INTEGER NOT NULL,
+    spend DECIMAL(15,2) NOT NULL,
+    cashback DECIMAL(15,2) NOT NULL,
+    goal_progress DECIMAL(9,4) NOT NULL,
+    computed_at TIMESTAMP NOT NULL,
+    PRIMARY KEY (user_id, campaign_id)
+);
@@ -0,0 +1,216 @@
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+from datetime import datetime
+
+import telemetry
+from core_transactions import load_transactions, truncate_tables
+from core_users import copy_load, insert_load
+from db import connection
+from ml_metas import load_campaigns
+from pg_statements import TOP_STATEMENTS, reset_server_statements, server_statements
+from synthetic import SyntheticUsers
+
+# Runs each loader in-process at several scales against the databases in
+# config.py and writes a JSON report of per-table throughput, bytes sent,
+# commits, per-batch latency and per-statement timings (client side, and
+# server side where pg_stat_statements is available). Pass a previous
+# report as --baseline to fail (exit 1) when a run got slower than the
+# tolerance allows.
+
+LOADERS = ("core_users", "core_transactions", "ml_metas")
+
+# Settings recorded with every report, so runs on differently tuned servers
+# are not compared blindly. ingest.profile is set by the tuning profiles in
+# postgres/profiles (empty when the server was started without one).
+SERVER_SETTINGS = ("server_version", "ingest.profile", "shared_buffers", "wal_buffers", "synchronous_commit",
+                   "full_page_writes", "wal_compression", "wal_level", "max_wal_size", "checkpoint_timeout",
+                   "work_mem", "maintenance_work_mem", "autovacuum")
+
+def environment():
+    """Describe the client and the three servers the benchmark ran against."""
+    servers = {}
+    for database in LOADERS:
+        with connection(database) as conn, conn.cursor() as cur:
+            settings = {}
+            for name in SERVER_SETTINGS:
+                cur.execute("SELECT current_setting(%s, true)", (name,))
+                settings[name] = cur.fetchone()[0]
+            servers[database] = settings
+    return {
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "servers": servers
+    }
+
+def reset_statements():
+    """Clear pg_stat_statements on the databases that have it, so the report only covers this run."""
+    for database in LOADERS:
+        with connection(database) as conn:
+            reset_server_statements(conn)
+
+def statements(runs):
+    """
+    Server-side statements of every database since reset_statements(), the
+    top TOP_STATEMENTS of each plus their correlation with the client-side
+    statistics of all runs. Empty where pg_stat_statements is missing.
+    """
+    client = {}
+    for run in runs:
+        telemetry.merge(client, run["statements"])
+    server = {}
+    for database in LOADERS:
+        with connection(database) as conn:
+            found = server_statements(conn, limit=None)
+        if found is not None:
+            server[database] = found
+    return {
+        "server": {database: found[:TOP_STATEMENTS] for database, found in server.items()},
+        "correlation": telemetry.correlate(client, server) if server else []
+    }
+
+def record(loader, users, mode, report, elapsed, **extra):
+    """Build one run entry from a loader's LoadReport and wall-clock time."""
+    summary = report.summary()
+    rows = sum(entry["rows"] for entry in summary["tables"].values())
+    run = {
+        "loader": loader,
+        "users": users,
+        "mode": mode,
+        "seconds": round(elapsed, 6),
+        "rows": rows,
+        "rows_per_second": round(rows / elapsed, 1) if elapsed else 0.0,
+        "bytes": sum(entry["bytes"] for entry in summary["tables"].values())
+    }
+    run.update(extra)
+    run.update(summary)
+    run["statements"] = telemetry.collect(report)
+    return run
+
+def run_scale(users, args):
+    """Run the selected loaders for one number of users. Returns the run entries."""
+    runs = []
+    if "core_users" in args.loaders:
+        for mode in args.modes:
+            generator = SyntheticUsers(seed=args.seed)
+            telemetry.drain()
+            started = time.perf_counter()
+            with connection("core_users", bulk=True) as conn:
+                if mode == "copy":
+                    report = copy_load(conn, users, generator)
+                else:
+                    report = insert_load(conn, users, generator)
+            runs.append(record("core_users", users, mode, report, time.perf_counter() - started))
+
+    if "core_transactions" in args.loaders:
+        # Empty the tables outside the timed run; the load's own TRUNCATE is then instant.
+        with connection("core_transactions") as conn:
+            truncate_tables(conn)
+        telemetry.drain()
+        started = time.perf_counter()
+        report, _, _ = load_transactions(args.workers, args.per_account, args.days, seed=args.seed)
+        runs.append(record("core_transactions", users, "copy", report, time.perf_counter() - started,
+                           workers=args.workers, per_account=args.per_account))
+
+    if "ml_metas" in args.loaders:
+        telemetry.drain()
+        started = time.perf_counter()
+        with connection("core_users") as conn_users, connection("ml_metas", bulk=True) as conn_metas:
+            report = load_campaigns(conn_users, conn_metas, args.campaigns, args.campaigns_per_batch, seed=args.seed)
+        runs.append(record("ml_metas", users, "set-based", report, time.perf_counter() - started,
+                           campaigns=args.campaigns))
+    return runs
+
+def compare(runs, baseline, tolerance):
+    """
+    Compare the rows/s of each run with the matching (loader, users, mode)
+    run of a baseline report. Returns the descriptions of the regressions.
+    """
+    previous = {(run["loader"], run["users"], run["mode"]): run for run in baseline["runs"]}
+    regressions = []
+    for run in runs:
+        base = previous.get((run["loader"], run["users"], run["mode"]))
+        if base is None or not base["rows_per_second"]:
+            continue
+        change = run["rows_per_second"] / base["rows_per_second"] - 1
+        line = (f"{run['loader']:<18} {run['users']:>10,} users  {run['mode']:<9} "
+                f"{base['rows_per_second']:>12,.0f} -> {run['rows_per_second']:>12,.0f} rows/s ({change:+.1%})")
+        print(line)
+        if change < -tolerance:
+            regressions.append(line)
+    return regressions
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Benchmark the loaders at several scales and write a JSON report. "
+                    "Every run replaces the data in the target databases.")
+    parser.add_argument("--scales", type=int, nargs="+", default=[1000, 100000],
+                        help="numbers of users to load, e.g. 1000 100000 10000000 (default: 1000 100000)")
+    parser.add_argument("--loaders", nargs="+", choices=LOADERS, default=list(LOADERS))
+    parser.add_argument("--modes", nargs="+", choices=["copy", "insert"], default=["copy"],
+                        help="core_users loader modes to compare (default: copy)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(),
+                        help="core_transactions worker processes (default: CPU count)")
+    parser.add_argument("--per-account", type=int, default=1,
+                        help="core_transactions card/paypal transactions per account (default: 1)")
+    parser.add_argument("--days", type=int, default=100,
+                        help="core_transactions time window in days (default: 100)")
+    parser.add_argument("--campaigns", type=int, default=50,
+                        help="ml_metas campaigns to create (default: 50)")
+    parser.add_argument("--campaigns-per-batch", type=int, default=100,
+                        help="ml_metas campaigns assigned per statement (default: 100)")
+    parser.add_argument("--seed", type=int, default=42,
+                        help="seed for the synthetic data, identical across runs (default: 42)")
+    parser.add_argument("--label", default=None,
+                        help="free-form label stored in the report, e.g. a branch or tuning profile")
+    parser.add_argument("--output", default=None,
+                        help="report path (default: bench_ingest_<timestamp>.json)")
+    parser.add_argument("--baseline", default=None,
+                        help="previous report to compare rows/s against")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="allowed rows/s drop against the baseline before failing (default: 0.2)")
+    args = parser.parse_args()
+    if args.campaigns < 1:
+        parser.error("--campaigns must be at least 1")
+    if args.campaigns_per_batch < 1:
+        parser.error("--campaigns-per-batch must be at least 1")
+    return args
+
+def main():
+    args = parse_args()
+    started_at = datetime.now()
+    reset_statements()
+    runs = []
+    for users in args.scales:
+        print(f"== {users:,} users")
+        for run in run_scale(users, args):
+            print(f"{run['loader']:<18} {run['mode']:<9} {run['rows']:>12,} rows  {run['seconds']:>9.2f} s  "
+                  f"{run['rows_per_second']:>12,.0f} rows/s  {run['commits']:>6} commits")
+            runs.append(run)
+
+    report = {
+        "label": args.label,
+        "started_at": started_at.isoformat(timespec="seconds"),
+        "environment": environment(),
+        "runs": runs,
+        "statements": statements(runs)
+    }
+    output = args.output or f"bench_ingest_{started_at:%Y%m%d_%H%M%S}.json"
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Report written to {output}.")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(runs, baseline, args.tolerance)
+        if regressions:
+            print(f"{len(regressions)} run(s) regressed by more than {args.tolerance:.0%}.")
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,157 @@
+import argparse
+import json
+import os
+import re
+import statistics
+
+from db import connection
+from ml_metas import CREDIT_CARD_ACTIVATIONS_SQL
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# The queries the ingest scripts and the operations consumers actually run,
+# per database: (name, SQL with pyformat parameters).
+QUERIES = {
+    "core_users": [
+        ("accounts by type and id range (core_transactions loader)",
+         "SELECT id, user_id, account_type FROM accounts "
+         "WHERE account_type IN ('credit_card', 'prepago') AND id BETWEEN %(low)s AND %(high)s ORDER BY id"),
+        ("credit_card activations (ml_metas loader)", CREDIT_CARD_ACTIVATIONS_SQL),
+        ("accounts of one user",
+         "SELECT * FROM accounts WHERE user_id = %(user_id)s"),
+        ("demographics of one user",
+         "SELECT * FROM demographics WHERE user_id = %(user_id)s"),
+    ],
+    "core_transactions": [
+        ("operations history of one user",
+         "SELECT * FROM operations WHERE user_id = %(user_id)s ORDER BY timestamp DESC LIMIT 50"),
+        ("operations of one user, last 30 days",
+         "SELECT * FROM operations WHERE user_id = %(user_id)s AND timestamp >= now() - interval '30 days'"),
+        ("mastercard spend of one user, last 30 days",
+         "SELECT sum(amount) FROM transactions_mastercard "
+         "WHERE user_id = %(user_id)s AND timestamp >= now() - interval '30 days'"),
+        ("internal transfers sent by one user",
+         "SELECT * FROM transactions_internal WHERE sender_id = %(user_id)s"),
+        ("internal transfers received by one user",
+         "SELECT * FROM transactions_internal WHERE receiver_id = %(user_id)s"),
+        ("daily spend of one user, last 30 days (rollups)",
+         "SELECT day, transaction_type, merchant, amount FROM user_daily_rollups "
+         "WHERE user_id = %(user_id)s AND day >= current_date - 29"),
+        ("top merchants, last 30 days (rollups)",
+         "SELECT merchant, sum(amount) FROM user_daily_rollups "
+         "WHERE day >= current_date - 29 AND transaction_type IN ('mastercard', 'paypal') "
+         "GROUP BY merchant ORDER BY 2 DESC LIMIT 10"),
+        ("operations refresh watermark",
+         "SELECT MAX(id) FROM transactions_mastercard WHERE id > %(watermark)s"),
+    ],
+    "ml_metas": [
+        ("campaign assignment of one user",
+         "SELECT * FROM user_campaigns WHERE user_id = %(user_id)s AND campaign_id = %(campaign_id)s"),
+        ("campaigns of one user",
+         "SELECT * FROM user_campaigns WHERE user_id = %(user_id)s"),
+        ("assignments listing one merchant",
+         "SELECT count(*) FROM user_campaigns WHERE merchant_list @> ARRAY['Target']::merchant[]"),
+        ("campaigns active today",
+         "SELECT * FROM campaigns WHERE start_date <= current_date AND end_date >= current_date"),
+    ],
+}
+
+# SQL returning one row of parameters for the queries of each database.
+PARAMETERS = {
+    "core_users": """
+        SELECT (SELECT user_id FROM accounts WHERE id >= (SELECT MAX(id) * random() FROM accounts) ORDER BY id LIMIT 1) AS user_id,
+               MAX(id) / 2 AS low, MAX(id) / 2 + MAX(id) / 32 AS high
+        FROM accounts
+    """,
+    "core_transactions": """
+        SELECT (SELECT user_id FROM transactions_mastercard ORDER BY id DESC LIMIT 1) AS user_id,
+               GREATEST(MAX(id) - 1000, 0) AS watermark
+        FROM transactions_mastercard
+    """,
+    "ml_metas": """
+        SELECT user_id, campaign_id FROM user_campaigns
+        WHERE id >= (SELECT MAX(id) * random() FROM user_campaigns) ORDER BY id LIMIT 1
+    """,
+}
+
+def index_names(database):
+    """Names of the indexes created by the database's versioned index set (indexes.sql)."""
+    with open(os.path.join(REPO_ROOT, f"db_{database}", "indexes.sql")) as f:
+        return re.findall(r"CREATE (?:UNIQUE )?INDEX IF NOT EXISTS (\w+)", f.read())
+
+def summarize_plan(node, steps=None):
+    """
+    Flatten an EXPLAIN JSON plan into distinct 'Node Type on relation using
+    index' steps. Monthly partitions are folded into their parent's name.
+    """
+    steps = [] if steps is None else steps
+    step = node["Node Type"]
+    if "Relation Name" in node:
+        step += f" on {node['Relation Name']}"
+    if "Index Name" in node:
+        step += f" using {node['Index Name']}"
+    step = re.sub(r"_\d{4}_\d{2}", "", step)
+    if step not in steps:
+        steps.append(step)
+    for child in node.get("Plans", []):
+        summarize_plan(child, steps)
+    return steps
+
+def explain(cur, sql, params, repeat):
+    """
+    Run sql under EXPLAIN ANALYZE `repeat` times. Returns the median execution
+    time in ms, the plan steps and the shared buffers touched by the last run.
+    """
+    timings = []
+    for _ in range(repeat):
+        cur.execute("EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) " + sql, params)
+        result = cur.fetchone()[0]
+        result = result[0] if isinstance(result, list) else json.loads(result)[0]
+        timings.append(result["Execution Time"])
+    plan = result["Plan"]
+    buffers = plan.get("Shared Hit Blocks", 0) + plan.get("Shared Read Blocks", 0)
+    return statistics.median(timings), summarize_plan(plan), buffers
+
+def bench_database(database, repeat):
+    """
+    Benchmark every query of one database with its index set, then again with
+    the index set dropped inside a transaction that is rolled back afterwards.
+    """
+    results = []
+    # The connection is rolled back when it goes back to the pool.
+    with connection(database) as conn, conn.cursor() as cur:
+        cur.execute(PARAMETERS[database])
+        row = cur.fetchone()
+        params = dict(zip([col.name for col in cur.description], row)) if row else {}
+        for name, sql in QUERIES[database]:
+            results.append({"query": name, "with_indexes": explain(cur, sql, params, repeat)})
+
+        for index in index_names(database):
+            cur.execute(f"DROP INDEX IF EXISTS {index}")
+        for result, (_, sql) in zip(results, QUERIES[database]):
+            result["without_indexes"] = explain(cur, sql, params, repeat)
+    return params, results
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Show plans and latency of the ingest scripts' queries with and without the index set. "
+                    "Load data first, e.g. core_users.py --users 1000000 and core_transactions.py --per-account 2.")
+    parser.add_argument("--repeat", type=int, default=5,
+                        help="executions per query; the median is reported (default: 5)")
+    parser.add_argument("--databases", nargs="+", choices=list(QUERIES), default=list(QUERIES))
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    for database in args.databases:
+        params, results = bench_database(database, args.repeat)
+        print(f"== db_{database} {params}")
+        for result in results:
+            with_ms, with_plan, with_buffers = result["with_indexes"]
+            without_ms, without_plan, without_buffers = result["without_indexes"]
+            print(f"  {result['query']}")
+            print(f"    indexed    {with_ms:>10.3f} ms  {with_buffers:>8} buffers  {' > '.join(with_plan)}")
+            print(f"    no indexes {without_ms:>10.3f} ms  {without_buffers:>8} buffers  {' > '.join(without_plan)}")
+
+if __name__ == '__main__':
+    main()
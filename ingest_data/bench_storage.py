@@ -0,0 +1,156 @@
+import argparse
+import json
+
+from bench_queries import explain
+from db import connection
+
+# Compares the enum / regions layout of the repeated labels (see init.sql)
+# with the VARCHAR layout it replaced. Each table is copied twice inside a
+# transaction that is rolled back afterwards: as it is stored now, and with
+# its enum columns cast back to varchar (and demographics joined back to the
+# country, state and city names). Both copies get the same label index; the
+# report is heap and index size per row and the median time of the label
+# scans the dashboards and the cashback engine run.
+
+# Per database: (table, SQL of the denormalized copy or None to cast every
+# enum column to varchar, label index (normalized, denormalized), scans
+# (name, normalized SQL, denormalized SQL)). {table} is replaced by the copy.
+TABLES = {
+    "core_transactions": [
+        ("transactions_mastercard", None, ("(merchant)", "(merchant)"), [
+            ("spend by merchant",
+             "SELECT merchant, count(*), sum(amount) FROM {table} GROUP BY merchant", None),
+            ("one merchant",
+             "SELECT count(*) FROM {table} WHERE merchant = 'Target'", None),
+        ]),
+        ("operations", None, ("(transaction_type, merchant)", "(transaction_type, merchant)"), [
+            ("amount by type and merchant",
+             "SELECT transaction_type, merchant, count(*), sum(amount) FROM {table} GROUP BY 1, 2", None),
+            ("card spend at one merchant",
+             "SELECT count(*), sum(amount) FROM {table} WHERE transaction_type = 'mastercard' AND merchant = 'Target'",
+             None),
+        ]),
+    ],
+    "core_users": [
+        ("accounts", None, ("(account_type)", "(account_type)"), [
+            ("accounts by type",
+             "SELECT account_type, count(*) FROM {table} GROUP BY account_type", None),
+        ]),
+        ("demographics",
+         "SELECT d.id, d.user_id, d.age, d.gender, d.income_level, r.country, r.state, r.city "
+         "FROM demographics d LEFT JOIN regions r ON r.id = d.region_id",
+         ("(region_id)", "(country, state, city)"), [
+            ("users by city",
+             "SELECT r.city, d.users FROM (SELECT region_id, count(*) AS users FROM {table} GROUP BY region_id) d "
+             "JOIN regions r ON r.id = d.region_id",
+             "SELECT city, count(*) FROM {table} GROUP BY city"),
+            ("users in one city",
+             "SELECT count(*) FROM {table} d JOIN regions r ON r.id = d.region_id WHERE r.city = 'Temuco'",
+             "SELECT count(*) FROM {table} WHERE city = 'Temuco'"),
+        ]),
+    ],
+    "ml_metas": [
+        ("user_campaigns", None, ("USING GIN (merchant_list)", "USING GIN (merchant_list)"), [
+            ("assignments listing one merchant",
+             "SELECT count(*) FROM {table} WHERE merchant_list @> ARRAY['Target']::merchant[]",
+             "SELECT count(*) FROM {table} WHERE merchant_list @> ARRAY['Target']::varchar[]"),
+        ]),
+    ],
+}
+
+def varchar_columns(cur, table):
+    """SELECT list of table with its enum (and enum array) columns cast to varchar."""
+    cur.execute("""
+        SELECT a.attname, t.typtype, e.typtype
+        FROM pg_attribute a
+        JOIN pg_type t ON t.oid = a.atttypid
+        LEFT JOIN pg_type e ON e.oid = t.typelem AND t.typcategory = 'A'
+        WHERE a.attrelid = %s::regclass AND a.attnum > 0 AND NOT a.attisdropped
+        ORDER BY a.attnum;
+    """, (table,))
+    columns = []
+    for name, kind, element_kind in cur.fetchall():
+        if kind == "e":
+            columns.append(f"{name}::varchar AS {name}")
+        elif element_kind == "e":
+            columns.append(f"{name}::varchar[] AS {name}")
+        else:
+            columns.append(name)
+    return ", ".join(columns)
+
+def measure(cur, copy, rows):
+    """Heap and index bytes of copy, in total and per row."""
+    cur.execute("SELECT pg_table_size(%s), pg_indexes_size(%s);", (copy, copy))
+    heap, index = cur.fetchone()
+    return {
+        "heap_bytes": heap,
+        "index_bytes": index,
+        "heap_bytes_per_row": round(heap / rows, 1) if rows else None,
+        "index_bytes_per_row": round(index / rows, 1) if rows else None
+    }
+
+def bench_table(cur, table, denormalized, indexes, scans, repeat):
+    """Build both copies of table, then measure their size and time their scans."""
+    cur.execute(f"SELECT count(*) FROM {table};")
+    rows = cur.fetchone()[0]
+    copies = {
+        "normalized": f"SELECT * FROM {table}",
+        "denormalized": denormalized or f"SELECT {varchar_columns(cur, table)} FROM {table}"
+    }
+    result = {"table": table, "rows": rows}
+    for (layout, select), index in zip(copies.items(), indexes):
+        copy = f"storage_bench_{table}_{layout}"
+        cur.execute(f"CREATE TABLE {copy} AS {select};")
+        cur.execute(f"CREATE INDEX ON {copy} {index};")
+        cur.execute(f"ANALYZE {copy};")
+        result[layout] = measure(cur, copy, rows)
+        result[layout]["scans"] = {}
+        for name, normalized_sql, denormalized_sql in scans:
+            sql = normalized_sql if layout == "normalized" else denormalized_sql or normalized_sql
+            # One unmeasured run sets hint bits and warms the buffers.
+            cur.execute(sql.format(table=copy))
+            ms, plan, buffers = explain(cur, sql.format(table=copy), None, repeat)
+            result[layout]["scans"][name] = {"ms": round(ms, 3), "buffers": buffers, "plan": " > ".join(plan)}
+    return result
+
+def bench_database(database, repeat):
+    """Benchmark the tables of one database; the copies are rolled back with the connection."""
+    with connection(database) as conn, conn.cursor() as cur:
+        return [bench_table(cur, *entry, repeat) for entry in TABLES[database]]
+
+def print_result(result):
+    normalized, denormalized = result["normalized"], result["denormalized"]
+    print(f"  {result['table']} ({result['rows']:,} rows)")
+    for layout, entry in (("normalized", normalized), ("varchar", denormalized)):
+        print(f"    {layout:<12} heap {entry['heap_bytes'] / 2**20:>9.1f} MiB ({entry['heap_bytes_per_row'] or 0:>6.1f} B/row)"
+              f"  index {entry['index_bytes'] / 2**20:>9.1f} MiB ({entry['index_bytes_per_row'] or 0:>6.1f} B/row)")
+    for name, scan in normalized["scans"].items():
+        other = denormalized["scans"][name]
+        print(f"    {name:<34} {scan['ms']:>10.3f} ms {scan['buffers']:>8} buffers   "
+              f"varchar {other['ms']:>10.3f} ms {other['buffers']:>8} buffers")
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Compare the size and label-scan time of the enum / regions layout with the VARCHAR one. "
+                    "Load data first, e.g. core_users.py --users 1000000 and core_transactions.py --per-account 2.")
+    parser.add_argument("--repeat", type=int, default=5,
+                        help="executions per scan; the median is reported (default: 5)")
+    parser.add_argument("--databases", nargs="+", choices=list(TABLES), default=list(TABLES))
+    parser.add_argument("--output", default=None,
+                        help="also write the results to this JSON file")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    report = {}
+    for database in args.databases:
+        report[database] = bench_database(database, args.repeat)
+        print(f"== db_{database}")
+        for result in report[database]:
+            print_result(result)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,184 @@
+import io
+import math
+import time
+from contextlib import contextmanager
+
+import telemetry
+
+# Helpers shared by the loaders for streaming generated rows into PostgreSQL
+# with COPY FROM STDIN instead of one INSERT (and one round trip) per row.
+
+# Number of rows buffered in memory before a COPY statement is flushed.
+COPY_CHUNK_ROWS = 50000
+
+# Id ranges handed out per worker by id_ranges() callers; more ranges than
+# workers keeps the pool busy when some ranges are denser than others.
+RANGES_PER_WORKER = 4
+
+def copy_value(value):
+    """Render a Python value as a field in PostgreSQL's COPY text format."""
+    if value is None:
+        return "\\N"
+    text = str(value)
+    return (text
+            .replace("\\", "\\\\")
+            .replace("\t", "\\t")
+            .replace("\n", "\\n")
+            .replace("\r", "\\r"))
+
+def copy_text(rows):
+    """Render an iterable of row tuples as one block of COPY text format lines."""
+    return "".join("\t".join(copy_value(v) for v in row) + "\n" for row in rows)
+
+def copy_rows(cur, table, columns, rows, chunk_rows=COPY_CHUNK_ROWS, counter=None):
+    """
+    Stream an iterable of row tuples into a table using COPY FROM STDIN.
+    Rows are buffered chunk_rows at a time, so the iterable can be a generator
+    of any length without being materialized. Returns the number of rows
+    copied; when counter (a LoadReport.track dict) is given, the rows and
+    bytes sent are also added to it.
+    """
+    sql = f"COPY {table} ({', '.join(columns)}) FROM STDIN"
+    buf = io.StringIO()
+    pending = 0
+    copied = 0
+    sent = 0
+
+    def flush():
+        buf.seek(0)
+        cur.copy_expert(sql, buf)
+        return len(buf.getvalue().encode()) if counter is not None else 0
+
+    for row in rows:
+        buf.write("\t".join(copy_value(v) for v in row))
+        buf.write("\n")
+        pending += 1
+        if pending >= chunk_rows:
+            sent += flush()
+            copied += pending
+            pending = 0
+            buf = io.StringIO()
+    if pending:
+        sent += flush()
+        copied += pending
+    if counter is not None:
+        counter["rows"] += copied
+        counter["bytes"] += sent
+    return copied
+
+def reserve_ids(cur, table, count, column="id"):
+    """
+    Reserve a block of count consecutive ids from the serial sequence behind
+    table.column and return the first one, so rows can be copied with ids
+    assigned client-side on top of existing data. Concurrent reservations
+    are serialized with a transaction-level advisory lock, which is held
+    until the caller commits. Returns None when count is not positive.
+    """
+    if count <= 0:
+        return None
+    cur.execute("SELECT pg_advisory_xact_lock(hashtext(%s));", (f"reserve_ids:{table}.{column}",))
+    cur.execute(
+        f"""
+        SELECT setval(seq, GREATEST(nextval(seq), (SELECT COALESCE(MAX({column}), 0) + 1 FROM {table})) + %s - 1)
+        FROM (SELECT pg_get_serial_sequence(%s, %s)::regclass AS seq) s;
+        """,
+        (count, table, column)
+    )
+    return cur.fetchone()[0] - count + 1
+
+def id_ranges(conn, table, column, parts, after=0):
+    """
+    Split the values of table.column above `after` into at most `parts`
+    contiguous [low, high] ranges, for worker processes to load
+    independently. Returns an empty list when there are none.
+    """
+    with conn.cursor() as cur:
+        cur.execute(f"SELECT MIN({column}), MAX({column}) FROM {table} WHERE {column} > %s", (after,))
+        low, high = cur.fetchone()
+    if low is None:
+        return []
+    step = max(1, -(-(high - low + 1) // parts))
+    return [(start, min(start + step - 1, high)) for start in range(low, high + 1, step)]
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of a list of numbers (0.0 when empty)."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, math.ceil(fraction * len(ordered)) - 1))]
+
+class LoadReport:
+    """
+    Accumulate rows, bytes sent, elapsed seconds and per-batch latencies per
+    table, plus the number of commits, and print or summarize throughput.
+    Worker processes also put their statement statistics (telemetry.drain())
+    in statements, for the parent to merge.
+    """
+
+    def __init__(self):
+        self.tables = {}
+        self.commits = 0
+        self.commit_seconds = 0.0
+        self.statements = {}
+
+    def _entry(self, table):
+        return self.tables.setdefault(table, {"rows": 0, "bytes": 0, "seconds": 0.0, "batches": []})
+
+    @contextmanager
+    def track(self, table):
+        """
+        Time a block that loads one batch of rows into table. The block adds
+        the rows (and, for COPY, bytes) it loaded to the yielded dict's "rows"
+        and "bytes" keys.
+        """
+        entry = self._entry(table)
+        counter = {"rows": 0, "bytes": 0}
+        started = time.perf_counter()
+        try:
+            yield counter
+        finally:
+            elapsed = time.perf_counter() - started
+            entry["seconds"] += elapsed
+            entry["rows"] += counter["rows"]
+            entry["bytes"] += counter["bytes"]
+            entry["batches"].append(elapsed)
+
+    def commit(self, conn):
+        """Commit conn, counting and timing the commit."""
+        started = time.perf_counter()
+        conn.commit()
+        self.commit_seconds += time.perf_counter() - started
+        self.commits += 1
+
+    def merge(self, other):
+        """Add the totals of another report (e.g. one returned by a worker process)."""
+        for table, other_entry in other.tables.items():
+            entry = self._entry(table)
+            entry["rows"] += other_entry["rows"]
+            entry["bytes"] += other_entry["bytes"]
+            entry["seconds"] += other_entry["seconds"]
+            entry["batches"].extend(other_entry["batches"])
+        self.commits += other.commits
+        self.commit_seconds += other.commit_seconds
+        telemetry.merge(self.statements, other.statements)
+
+    def summary(self):
+        """Return a JSON-serializable dict of per-table throughput and batch latency."""
+        tables = {}
+        for table, entry in self.tables.items():
+            tables[table] = {
+                "rows": entry["rows"],
+                "bytes": entry["bytes"],
+                "seconds": round(entry["seconds"], 6),
+                "rows_per_second": round(entry["rows"] / entry["seconds"], 1) if entry["seconds"] else 0.0,
+                "batches": len(entry["batches"]),
+                "batch_p50_ms": round(percentile(entry["batches"], 0.50) * 1000, 3),
+                "batch_p99_ms": round(percentile(entry["batches"], 0.99) * 1000, 3)
+            }
+        return {"commits": self.commits, "commit_seconds": round(self.commit_seconds, 6), "tables": tables}
+
+    def print(self):
+        for table, entry in self.summary()["tables"].items():
+            print(f"  {table:<24} {entry['rows']:>12,} rows  {entry['seconds']:>9.2f} s  "
+                  f"{entry['rows_per_second']:>12,.0f} rows/s  "
+                  f"batch p50 {entry['batch_p50_ms']:>9.1f} ms  p99 {entry['batch_p99_ms']:>9.1f} ms")
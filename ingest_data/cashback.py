@@ -0,0 +1,182 @@
+import argparse
+import os
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+from decimal import Decimal
+from multiprocessing import Pool
+
+import telemetry
+from bulk import RANGES_PER_WORKER, LoadReport, copy_rows, id_ranges
+from db import close_pools, connection, read_connection, stream
+
+# Cashback engine: matches the card and paypal operations in
+# db_core_transactions against the user_campaigns assignments in db_ml_metas
+# and writes each assignment's spend, cashback and goal progress to
+# user_campaign_cashback. An operation counts for an assignment when it
+# happened between the campaign's start and end dates (inclusive) at one of
+# the assignment's merchants and was approved (declined payments never
+# happened).
+#
+# The user id space is split into ranges loaded by worker processes. Each
+# worker builds a hash table of its users' assignments, streams their
+# operations window by window (from the core_transactions replica when one
+# is up to date) and joins them in memory.
+
+SPEND_TYPES = ("mastercard", "paypal")
+SETTLED_STATUSES = ("approved", "completed")
+
+CASHBACK_COLUMNS = ("user_id", "campaign_id", "operations", "spend", "cashback", "goal_progress", "computed_at")
+
+def load_assignments(conn, low, high):
+    """
+    Return {user_id: [(start, end, merchants, campaign_id)]} for the users in
+    [low, high], with the campaign window as [start, end) timestamps, and
+    {campaign_id: (cashback fraction, goal)}.
+    """
+    assignments = defaultdict(list)
+    campaigns = {}
+    for chunk in stream(conn, """
+        SELECT uc.user_id, uc.campaign_id, uc.merchant_list, uc.start_date, uc.end_date,
+               c.cashback_percentage, c.goal
+        FROM user_campaigns uc
+        JOIN campaigns c ON c.id = uc.campaign_id
+        WHERE uc.user_id BETWEEN %s AND %s
+    """, (low, high)):
+        for user_id, campaign_id, merchants, start, end, percentage, goal in chunk:
+            window = (datetime.combine(start, datetime.min.time()),
+                      datetime.combine(end + timedelta(days=1), datetime.min.time()))
+            assignments[user_id].append((*window, frozenset(merchants or ()), campaign_id))
+            campaigns[campaign_id] = (percentage / 100, goal)
+    return assignments, campaigns
+
+def windows(start, end, days):
+    """Split [start, end) into consecutive windows of at most `days` days."""
+    while start < end:
+        yield start, min(start + timedelta(days=days), end)
+        start += timedelta(days=days)
+
+def compute_range(task):
+    """
+    Compute the cashback of every assignment of the users in one [low, high]
+    range and upsert it into user_campaign_cashback. Returns the worker's
+    LoadReport (with its statement statistics) and the number of operations
+    scanned and matched.
+    """
+    low, high, options = task
+    report = LoadReport()
+    scanned = matched = 0
+
+    with connection("ml_metas", bulk=True) as metas_conn, read_connection("core_transactions") as trans_conn:
+        assignments, campaigns = load_assignments(metas_conn, low, high)
+        totals = {(user_id, a[3]): [0, Decimal(0)] for user_id, user_assignments in assignments.items()
+                  for a in user_assignments}
+        if not totals:
+            report.statements = telemetry.drain()
+            return report, scanned, matched
+
+        # Only the time span some assignment of these users covers is read,
+        # up to the shared "now". The totals always cover whole campaigns, as
+        # they replace the stored ones.
+        start = min(a[0] for user in assignments.values() for a in user)
+        end = min(max(a[1] for user in assignments.values() for a in user), options["now"])
+
+        for window_start, window_end in windows(start, end, options["window_days"]):
+            with report.track("operations") as counter:
+                for chunk in stream(trans_conn, """
+                    SELECT user_id, amount, merchant, timestamp FROM operations
+                    WHERE user_id BETWEEN %s AND %s AND timestamp >= %s AND timestamp < %s
+                      AND transaction_type IN %s AND status IN %s
+                """, (low, high, window_start, window_end, SPEND_TYPES, SETTLED_STATUSES),
+                        options["chunk_size"]):
+                    for user_id, amount, merchant, timestamp in chunk:
+                        for campaign_start, campaign_end, merchants, campaign_id in assignments.get(user_id, ()):
+                            if campaign_start <= timestamp < campaign_end and merchant in merchants:
+                                total = totals[user_id, campaign_id]
+                                total[0] += 1
+                                total[1] += amount
+                                matched += 1
+                    counter["rows"] += len(chunk)
+                    scanned += len(chunk)
+            trans_conn.commit()
+
+        computed_at = datetime.now()
+        results = []
+        for (user_id, campaign_id), (operations, spend) in totals.items():
+            fraction, goal = campaigns[campaign_id]
+            progress = min(spend / goal, Decimal(99999)) if goal else Decimal(0)
+            results.append((user_id, campaign_id, operations, spend, round(spend * fraction, 2),
+                            round(progress, 4), computed_at))
+
+        with metas_conn.cursor() as cur, report.track("user_campaign_cashback") as counter:
+            cur.execute("""
+                CREATE TEMPORARY TABLE cashback_staging
+                (LIKE user_campaign_cashback) ON COMMIT DROP;
+            """)
+            copy_rows(cur, "cashback_staging", CASHBACK_COLUMNS, results, counter=counter)
+            cur.execute(f"""
+                INSERT INTO user_campaign_cashback ({', '.join(CASHBACK_COLUMNS)})
+                SELECT {', '.join(CASHBACK_COLUMNS)} FROM cashback_staging
+                ON CONFLICT (user_id, campaign_id) DO UPDATE
+                SET operations = EXCLUDED.operations,
+                    spend = EXCLUDED.spend,
+                    cashback = EXCLUDED.cashback,
+                    goal_progress = EXCLUDED.goal_progress,
+                    computed_at = EXCLUDED.computed_at;
+            """)
+            report.commit(metas_conn)
+
+    report.statements = telemetry.drain()
+    return report, scanned, matched
+
+def compute_cashback(workers, window_days=7, chunk_size=10000):
+    """
+    Recompute user_campaign_cashback from every operation made up to now
+    with a pool of `workers` processes. Returns the merged LoadReport and
+    the operations scanned and matched.
+    """
+    options = {
+        "window_days": window_days,
+        # Operations made after this are left for the next run, in every range.
+        "now": datetime.now(),
+        "chunk_size": chunk_size
+    }
+    with connection("ml_metas") as metas_conn:
+        ranges = id_ranges(metas_conn, "user_campaigns", "user_id", workers * RANGES_PER_WORKER)
+
+    close_pools()
+
+    report = LoadReport()
+    scanned = matched = 0
+    with Pool(workers) as pool:
+        for worker_report, worker_scanned, worker_matched in pool.imap_unordered(
+                compute_range, [(low, high, options) for low, high in ranges]):
+            report.merge(worker_report)
+            scanned += worker_scanned
+            matched += worker_matched
+    return report, scanned, matched
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Compute cashback and goal progress of every campaign assignment from the operations.")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(),
+                        help="worker processes, each handling ranges of user ids (default: CPU count)")
+    parser.add_argument("--window-days", type=int, default=7,
+                        help="days of operations read per query (default: 7)")
+    telemetry.add_metrics_argument(parser)
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    started = time.perf_counter()
+    report, scanned, matched = compute_cashback(args.workers, args.window_days)
+    elapsed = time.perf_counter() - started
+
+    print(f"Scanned {scanned:,} operations, {matched:,} matched an assignment, in {elapsed:.2f} s "
+          f"with {args.workers} workers; per-table throughput (summed worker time):")
+    report.print()
+    if args.metrics:
+        telemetry.write_metrics(args.metrics, telemetry.collect(report))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+import os
+
+# Connection settings for the three databases, defaulting to the ports
+# published by docker-compose. Every field can be overridden per database with
+# an environment variable named <DATABASE>_<FIELD>, e.g. CORE_USERS_HOST or
+# CORE_TRANSACTIONS_PORT, and INGEST_DB_HOST points all three at another host.
+DATABASES = {
+    "core_users": {
+        "host": "localhost",
+        "port": 5432,
+        "dbname": "core_users",
+        "user": "postgres",
+        "password": "postgres"
+    },
+    "core_transactions": {
+        "host": "localhost",
+        "port": 5433,
+        "dbname": "core_transactions",
+        "user": "postgres",
+        "password": "postgres"
+    },
+    "ml_metas": {
+        "host": "localhost",
+        "port": 5434,
+        "dbname": "ml_metas",
+        "user": "postgres",
+        "password": "postgres"
+    }
+}
+
+# Hot standbys of the primaries above (docker-compose "replicas" profile),
+# used by db.read_connection() for read-only queries. Fields not given are
+# the primary's; override them with <DATABASE>_REPLICA_<FIELD>, e.g.
+# CORE_TRANSACTIONS_REPLICA_PORT. INGEST_READ_REPLICAS=0 sends every read to
+# the primaries.
+REPLICAS = {
+    "core_transactions": {"port": 5435},
+    "core_users": {"port": 5436}
+}
+READ_REPLICAS = os.environ.get("INGEST_READ_REPLICAS", "1") != "0"
+
+# Seconds to wait for a replica to accept a connection before reading from
+# the primary instead. Replicas only run under the opt-in compose profile,
+# so this bounds the cost of probing one that isn't there.
+REPLICA_CONNECT_TIMEOUT_SECONDS = int(os.environ.get("INGEST_REPLICA_CONNECT_TIMEOUT", 2))
+
+# Replay lag, in seconds, beyond which reads go back to the primary.
+REPLICA_MAX_LAG_SECONDS = float(os.environ.get("INGEST_REPLICA_MAX_LAG", 5))
+
+# Largest number of connections each process keeps open per database.
+POOL_MAX_CONNECTIONS = int(os.environ.get("INGEST_POOL_MAX_CONNECTIONS", 8))
+
+# Session settings applied to connections borrowed for bulk loads. Losing the
+# last few commits on a server crash is acceptable for generated data.
+BULK_SESSION_SETTINGS = {
+    "synchronous_commit": os.environ.get("INGEST_BULK_SYNCHRONOUS_COMMIT", "off")
+}
+
+def connection_params(name, replica=False):
+    """
+    Return the psycopg2.connect() keyword arguments for a database (or, with
+    replica=True, its entry in REPLICAS with a connect_timeout of
+    REPLICA_CONNECT_TIMEOUT_SECONDS), with environment overrides.
+    """
+    params = dict(DATABASES[name])
+    if "INGEST_DB_HOST" in os.environ:
+        params["host"] = os.environ["INGEST_DB_HOST"]
+    prefix = name.upper()
+    if replica:
+        params["connect_timeout"] = REPLICA_CONNECT_TIMEOUT_SECONDS
+        params.update(REPLICAS[name])
+        prefix += "_REPLICA"
+    for field in params:
+        value = os.environ.get(f"{prefix}_{field.upper()}")
+        if value is not None:
+            params[field] = value
+    return params
@@ -1,154 +1,235 @@
-import psycopg2
-import random
+import argparse
+import os
+import time
 from datetime import datetime, timedelta
+from multiprocessing import Pool
 
-# Connection parameters for the databases.
-# core_users holds the accounts and users data.
-CORE_USERS_CONN = {
-    "host": "localhost",
-    "port": 5432,
-    "dbname": "core_users",
-    "user": "postgres",
-    "password": "postgres"
-}
-
-# core_transactions holds the transactions tables and the view.
-CORE_TRANS_CONN = {
-    "host": "localhost",
-    "port": 5433,
-    "dbname": "core_transactions",
-    "user": "postgres",
-    "password": "postgres"
-}
-
-def random_date():
-    """Return a random datetime within the past 100 days."""
-    now = datetime.now()
-    delta = timedelta(days=random.randint(0, 100),
-                      hours=random.randint(0, 23),
-                      minutes=random.randint(0, 59))
-    return now - delta
-
-def get_accounts(conn, account_type):
+import telemetry
+from bulk import COPY_CHUNK_ROWS, RANGES_PER_WORKER, LoadReport, copy_rows, id_ranges
+from db import close_pools, connection, current_lsn, read_connection, stream
+from rollups import refresh_rollups
+from synthetic import (INTERNAL_PER_SAVINGS_ACCOUNT, MASTERCARD_AMOUNTS, PAYPAL_AMOUNTS,
+                       SyntheticTransactions, rows)
+
+# Account types feeding each transaction stream.
+MASTERCARD_ACCOUNT_TYPES = ("credit_card", "prepago")
+PAYPAL_ACCOUNT_TYPES = ("paypal",)
+INTERNAL_ACCOUNT_TYPES = ("savings",)
+
+def iter_accounts(conn, account_types, low, high, chunk_size):
+    """
+    Stream the accounts of the given types whose id is in [low, high] from
+    the core_users DB through a server-side cursor. Yields lists of at most
+    chunk_size tuples (account_id, user_id, account_type).
+    """
+    return stream(
+        conn,
+        """
+        SELECT id, user_id, account_type FROM accounts
+        WHERE account_type IN %s AND id BETWEEN %s AND %s
+        ORDER BY id
+        """,
+        (tuple(account_types), low, high),
+        chunk_size
+    )
+
+def accounts_watermark(conn):
     """
-    Retrieve accounts of a given type from the core_users DB.
-    Returns a list of tuples (account_id, user_id, account_type).
+    Return the highest account id whose transactions were already loaded, as
+    recorded in refresh_watermarks under the "transactions_loader" consumer
+    (0 before the first load).
     """
     with conn.cursor() as cur:
-        cur.execute("SELECT id, user_id, account_type FROM accounts WHERE account_type = %s", (account_type,))
-        return cur.fetchall()
-
-def insert_transaction(conn, table, user_id, amount, merchant, account_type, ts, status):
+        cur.execute("""
+            SELECT last_id FROM refresh_watermarks
+            WHERE consumer = 'transactions_loader' AND source_table = 'accounts';
+        """)
+        row = cur.fetchone()
+    return row[0] if row else 0
+
+def advance_accounts_watermark(conn, last_id, replace=False):
     """
-    Insert a transaction record into a specified transactions table.
+    Record that the transactions of every account up to last_id are loaded.
+    The watermark only moves forward unless replace=True, which a full load
+    needs: account ids restart at 1 when core_users is reloaded.
     """
+    last_id_sql = "EXCLUDED.last_id" if replace else "GREATEST(refresh_watermarks.last_id, EXCLUDED.last_id)"
     with conn.cursor() as cur:
-        query = f"""
-            INSERT INTO {table} (user_id, amount, merchant, account_type, timestamp, status)
-            VALUES (%s, %s, %s, %s, %s, %s)
-        """
-        cur.execute(query, (user_id, amount, merchant, account_type, ts, status))
+        cur.execute(f"""
+            INSERT INTO refresh_watermarks (consumer, source_table, last_id, refreshed_at)
+            VALUES ('transactions_loader', 'accounts', %s, now())
+            ON CONFLICT (consumer, source_table)
+            DO UPDATE SET last_id = {last_id_sql},
+                          refreshed_at = EXCLUDED.refreshed_at;
+        """, (last_id,))
+    conn.commit()
+
+def truncate_tables(conn):
+    """Empty the transactions tables, operations, the rollups and the refresh watermarks."""
+    with conn.cursor() as cur:
+        cur.execute("""
+            TRUNCATE TABLE transactions_mastercard, transactions_paypal, transactions_internal,
+                           operations, user_daily_rollups, refresh_watermarks
+            RESTART IDENTITY;
+        """)
     conn.commit()
 
-def insert_internal_transaction(conn, sender_id, receiver_id, amount, account_type, ts, status):
+def ensure_partitions(conn, start, end):
     """
-    Insert a record into transactions_internal.
+    Create the monthly partitions of the transactions tables and operations
+    covering [start, end] (see ensure_monthly_partitions() in init.sql), so
+    every generated row has a partition to be routed to. Returns the number
+    of partitions created.
     """
     with conn.cursor() as cur:
-        query = """
-            INSERT INTO transactions_internal (sender_id, receiver_id, amount, account_type, timestamp, status)
-            VALUES (%s, %s, %s, %s, %s, %s)
-        """
-        cur.execute(query, (sender_id, receiver_id, amount, account_type, ts, status))
+        cur.execute("SELECT ensure_monthly_partitions(%s, %s);", (start, end))
+        created = cur.fetchone()[0]
     conn.commit()
+    return created
 
-def create_operations_view(conn):
+def refresh_operations(conn):
     """
-    Drop any existing operations view and create a new view that unifies the
-    three transactions tables. For internal transactions, two rows are created:
-      - one for the sender (with negative amount)
-      - one for the receiver (with positive amount)
+    Append the transactions inserted since the last refresh to the
+    operations table (see refresh_operations() in init.sql). Returns the
+    number of operations rows added.
     """
     with conn.cursor() as cur:
-        cur.execute("DROP VIEW IF EXISTS operations;")
-        view_query = """
-        CREATE VIEW operations AS
-        SELECT row_number() OVER () AS id, user_id, amount, transaction_type, line_id, timestamp
-        FROM (
-            SELECT id, user_id, amount, 'mastercard' AS transaction_type, id AS line_id, timestamp 
-            FROM transactions_mastercard
-            UNION ALL
-            SELECT id, user_id, amount, 'paypal' AS transaction_type, id AS line_id, timestamp 
-            FROM transactions_paypal
-            UNION ALL
-            SELECT id, sender_id AS user_id, -amount AS amount, 'internal_send' AS transaction_type, id AS line_id, timestamp 
-            FROM transactions_internal
-            UNION ALL
-            SELECT id, receiver_id AS user_id, amount AS amount, 'internal_receive' AS transaction_type, id AS line_id, timestamp 
-            FROM transactions_internal
-        ) t;
-        """
-        cur.execute(view_query)
+        cur.execute("SELECT refresh_operations();")
+        added = cur.fetchone()[0]
     conn.commit()
+    return added
+
+def load_range(task):
+    """
+    Generate and load every transaction stream for the accounts whose id falls
+    in one [low, high] range. Accounts are streamed in chunks sized so each
+    chunk yields about batch_size rows, which are copied and committed
+    together; memory stays flat regardless of the number of accounts.
+    Returns the worker's LoadReport, with its statement statistics, for the
+    parent to merge. Each worker process borrows connections from its own
+    pools, which are reused across the ranges it handles.
+    """
+    low, high, options = task
+    seed = None if options["seed"] is None else options["seed"] + low
+    generator = SyntheticTransactions(seed=seed, now=options["now"], days=options["days"])
+    per_account = options["per_account"]
+    batch_size = options["batch_size"]
+    accounts_per_chunk = max(2, batch_size // per_account)
+    report = LoadReport()
+
+    with read_connection("core_users", min_lsn=options["users_lsn"]) as users_conn, connection("core_transactions", bulk=True) as trans_conn:
+
+        def load_batch(table, columns):
+            with trans_conn.cursor() as cur, report.track(table) as counter:
+                copy_rows(cur, table, columns.keys(), rows(columns), batch_size, counter)
+                report.commit(trans_conn)
+
+        # === Transactions for Mastercard (credit_card and prepago) and Paypal ===
+        for table, account_types, amounts in (
+            ("transactions_mastercard", MASTERCARD_ACCOUNT_TYPES, MASTERCARD_AMOUNTS),
+            ("transactions_paypal", PAYPAL_ACCOUNT_TYPES, PAYPAL_AMOUNTS),
+        ):
+            for accounts in iter_accounts(users_conn, account_types, low, high, accounts_per_chunk):
+                _, user_ids, acc_types = zip(*accounts)
+                load_batch(table, generator.card(user_ids, acc_types, per_account, amounts))
+
+        # === Internal Transactions between owners of savings accounts in the same chunk ===
+        for accounts in iter_accounts(users_conn, INTERNAL_ACCOUNT_TYPES, low, high, accounts_per_chunk):
+            savings_user_ids = [acct[1] for acct in accounts]
+            transfers = round(len(savings_user_ids) * INTERNAL_PER_SAVINGS_ACCOUNT * per_account)
+            if len(savings_user_ids) >= 2 and transfers:
+                load_batch("transactions_internal", generator.internal(savings_user_ids, transfers))
+
+    report.statements = telemetry.drain()
+    return report
+
+def load_transactions(workers, per_account, days, batch_size=COPY_CHUNK_ROWS, seed=None, append=False):
+    """
+    Load transactions for every account in db_core_users with a pool of
+    `workers` processes, then refresh operations and the daily rollups.
+    Unless append=True the transactions, operations and rollups are emptied
+    first; with append=True only the accounts created since the last load
+    (above the accounts watermark) get transactions. Returns the merged
+    LoadReport, the total transactions loaded and the wall-clock seconds the
+    workers took.
+    """
+    options = {
+        "per_account": per_account,
+        "days": days,
+        "batch_size": batch_size,
+        "seed": seed,
+        # One shared "now" keeps every worker's time window identical.
+        "now": datetime.now()
+    }
+
+    # Make sure every month of the time window has its partitions.
+    with connection("core_transactions") as trans_conn:
+        if not append:
+            truncate_tables(trans_conn)
+        ensure_partitions(trans_conn, options["now"] - timedelta(days=days + 1), options["now"])
+        after = accounts_watermark(trans_conn) if append else 0
+
+    # Split the accounts id space into ranges the workers load independently.
+    # Workers read the accounts from the core_users replica once it has
+    # replayed every account counted here.
+    with connection("core_users") as users_conn:
+        ranges = id_ranges(users_conn, "accounts", "id", workers * RANGES_PER_WORKER, after)
+        options["users_lsn"] = current_lsn(users_conn)
+
+    # Workers open their own connections; don't hand them ours across fork.
+    close_pools()
+
+    report = LoadReport()
+    started = time.perf_counter()
+    with Pool(workers) as pool:
+        for worker_report in pool.imap_unordered(load_range, [(low, high, options) for low, high in ranges]):
+            report.merge(worker_report)
+    elapsed = time.perf_counter() - started
+    total = sum(entry["rows"] for entry in report.tables.values())
+
+    # === Bring operations and the rollups up to date and move the accounts watermark ===
+    with connection("core_transactions") as trans_conn:
+        with report.track("operations") as counter:
+            counter["rows"] = refresh_operations(trans_conn)
+        with report.track("user_daily_rollups") as counter:
+            counter["rows"] = refresh_rollups(trans_conn)
+        if ranges or not append:
+            advance_accounts_watermark(trans_conn, ranges[-1][1] if ranges else 0, replace=not append)
+
+    return report, total, elapsed
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Generate transactions for the accounts in db_core_users.")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(),
+                        help="worker processes, each with its own connections (default: CPU count)")
+    parser.add_argument("--per-account", type=int, default=1,
+                        help="card/paypal transactions per account; internal transfers scale with it (default: 1)")
+    parser.add_argument("--days", type=int, default=100,
+                        help="spread transaction timestamps over this many days before now (default: 100)")
+    parser.add_argument("--batch-size", type=int, default=COPY_CHUNK_ROWS,
+                        help="rows copied per COPY statement and commit")
+    parser.add_argument("--append", action="store_true",
+                        help="only generate transactions for accounts created since the last load")
+    parser.add_argument("--seed", type=int, default=None,
+                        help="seed for the synthetic data generator (default: random)")
+    telemetry.add_metrics_argument(parser)
+    args = parser.parse_args()
+    if args.workers < 1:
+        parser.error("--workers must be at least 1")
+    if args.per_account < 1:
+        parser.error("--per-account must be at least 1")
+    return args
 
 def main():
-    # Connect to core_users (for accounts and users data)
-    users_conn = psycopg2.connect(**CORE_USERS_CONN)
-    # Connect to core_transactions (for transactions and view)
-    trans_conn = psycopg2.connect(**CORE_TRANS_CONN)
-
-    merchants = ["Amazon", "Walmart", "BestBuy", "Target", "Starbucks"]
-
-    # === Transactions for Mastercard (for credit_card and prepago accounts) ===
-    # Fetch accounts from core_users
-    credit_accounts = get_accounts(users_conn, 'credit_card')
-    prepago_accounts = get_accounts(users_conn, 'prepago')
-    mastercard_accounts = credit_accounts + prepago_accounts
-
-    # Insert one transaction per eligible account into transactions_mastercard
-    for account in mastercard_accounts:
-        _, user_id, acc_type = account
-        amount = round(random.uniform(10, 1000), 2)
-        merchant = random.choice(merchants)
-        ts = random_date()
-        status = random.choice(["approved", "declined"])
-        insert_transaction(trans_conn, "transactions_mastercard", user_id, amount, merchant, acc_type, ts, status)
-
-    # === Transactions for Paypal ===
-    paypal_accounts = get_accounts(users_conn, 'paypal')
-    for account in paypal_accounts:
-        _, user_id, acc_type = account
-        amount = round(random.uniform(5, 500), 2)
-        merchant = random.choice(merchants)
-        ts = random_date()
-        status = random.choice(["approved", "declined"])
-        insert_transaction(trans_conn, "transactions_paypal", user_id, amount, merchant, acc_type, ts, status)
-
-    # === Internal Transactions (e.g., transfers using savings accounts) ===
-    savings_accounts = get_accounts(users_conn, 'savings')
-    # Extract the user_ids for savings accounts (there should be 100 as per your distribution)
-    savings_user_ids = [acct[1] for acct in savings_accounts]
-
-    # Create 50 internal transactions by randomly selecting distinct sender and receiver
-    for _ in range(50):
-        sender = random.choice(savings_user_ids)
-        receiver = random.choice(savings_user_ids)
-        while receiver == sender:
-            receiver = random.choice(savings_user_ids)
-        amount = round(random.uniform(1, 300), 2)
-        ts = random_date()
-        status = random.choice(["completed", "pending"])
-        # Here, the account_type is assumed to be "savings" for the transfer
-        insert_internal_transaction(trans_conn, sender, receiver, amount, "savings", ts, status)
-
-    # === Create or Replace the operations view ===
-    create_operations_view(trans_conn)
-    
-    print("Transactions ingested and operations view created successfully.")
-
-    # Close both connections.
-    users_conn.close()
-    trans_conn.close()
+    args = parse_args()
+    report, total, elapsed = load_transactions(args.workers, args.per_account, args.days,
+                                               args.batch_size, args.seed, args.append)
+
+    print("Transactions ingested and operations refreshed successfully.")
+    print(f"{total:,} rows in {elapsed:.2f} s with {args.workers} workers ({total / elapsed if elapsed else 0:,.0f} rows/s); per-table throughput (summed worker time):")
+    report.print()
+    if args.metrics:
+        telemetry.write_metrics(args.metrics, telemetry.collect(report))
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
@@ -1,272 +1,197 @@
-import psycopg2
-import random
-import string
-from datetime import datetime, timedelta
+import argparse
 
-# Lists of common Chilean first names and surnames.
-male_first_names = [
-    "Juan", "Carlos", "Pedro", "Miguel", "Andrés",
-    "Jorge", "Ricardo", "Francisco", "Sebastián", "Diego"
-]
-female_first_names = [
-    "María", "Camila", "Sofía", "Isabella", "Valentina",
-    "Fernanda", "Catalina", "Gabriela", "Antonella", "Julieta"
-]
-last_names = [
-    "González", "Rodríguez", "Pérez", "Martínez", "Sánchez",
-    "Ramírez", "Torres", "Flores", "Díaz", "Reyes"
-]
+import telemetry
+from bulk import COPY_CHUNK_ROWS, LoadReport, copy_rows, reserve_ids
+from db import connection, execute_prepared
+from synthetic import CARD_ACCOUNT_TYPES, SyntheticUsers, account_counts, chile_locations, rows
 
-# Common email domains.
-email_domains = ["gmail.com", "hotmail.cl", "yahoo.com", "outlook.com"]
-
-# Chilean regions and cities (simplified).
-chile_locations = [
-    ("Región Metropolitana", "Santiago"),
-    ("Región de Valparaíso", "Valparaíso"),
-    ("Región del Biobío", "Concepción"),
-    ("Región de Coquimbo", "La Serena"),
-    ("Región de Antofagasta", "Antofagasta"),
-    ("Región de La Araucanía", "Temuco"),
-    ("Región de O'Higgins", "Rancagua"),
-    ("Región de Los Lagos", "Puerto Montt"),
-    ("Región de Magallanes", "Punta Arenas"),
-    ("Región de Tarapacá", "Iquique")
-]
-
-def random_activation_date():
-    """Return a datetime up to 100 days ago."""
-    days_ago = random.randint(0, 100)
-    return datetime.now() - timedelta(days=days_ago)
-
-def random_phone():
-    """Generate a realistic Chilean mobile number in format: +56 9 XXXX XXXX"""
-    number = ''.join(random.choices(string.digits, k=8))
-    return f"+56 9 {number[:4]} {number[4:]}"
-
-def generate_full_name(gender):
-    """Generate a realistic full name based on gender."""
-    if gender == "Male":
-        first = random.choice(male_first_names)
-    elif gender == "Female":
-        first = random.choice(female_first_names)
-    else:  # For 'Other', pick from both lists
-        first = random.choice(male_first_names + female_first_names)
-    last = random.choice(last_names)
-    return f"{first} {last}"
-
-def generate_email(full_name):
-    """Generate an email from the full name with a random domain."""
-    # Remove accents and lower the text (for simplicity, we only replace a few common ones)
-    normalized = (full_name
-                  .replace("á", "a")
-                  .replace("é", "e")
-                  .replace("í", "i")
-                  .replace("ó", "o")
-                  .replace("ú", "u")
-                  .replace("Á", "A")
-                  .replace("É", "E")
-                  .replace("Í", "I")
-                  .replace("Ó", "O")
-                  .replace("Ú", "U"))
-    username = ".".join(normalized.split()).lower()
-    # Append a random two-digit number to help ensure uniqueness
-    suffix = random.randint(10, 99)
-    domain = random.choice(email_domains)
-    return f"{username}{suffix}@{domain}"
-
-def main():
-    # Generate user data for 100 Chilean citizens.
-    users_data = []
-    for _ in range(100):
-        # Randomly select a gender.
-        gender = random.choice(["Male", "Female", "Other"])
-        full_name = generate_full_name(gender)
-        email = generate_email(full_name)
-        phone = random_phone()
-        age = random.randint(18, 80)
-        income_level = random.choice(["Low", "Medium", "High"])
-        region, city = random.choice(chile_locations)
-        
-        users_data.append({
-            "name": full_name,
-            "email": email,
-            "phone": phone,
-            "gender": gender,
-            "age": age,
-            "income_level": income_level,
-            "region": region,
-            "city": city
-        })
-
-    # Connection parameters – adjust these as needed.
-    conn = psycopg2.connect(
-        host="localhost",
-        port=5432,
-        dbname="core_users",  # Adjust if your DB name is different.
-        user="postgres",
-        password="postgres"
-    )
-    cur = conn.cursor()
-
-    # -------------------------------
-    # TRUNCATE existing data in dependent order.
-    # -------------------------------
+def truncate_tables(cur):
+    """TRUNCATE existing data in dependent order."""
     cur.execute("""
-        TRUNCATE TABLE card_info, accounts, user_status, onboarding, demographics, users 
+        TRUNCATE TABLE card_info, accounts, user_status, onboarding, demographics, users
         RESTART IDENTITY CASCADE;
     """)
+
+def insert_rows(cur, table, columns):
+    """
+    Insert a dict of column arrays into table with one INSERT per row, run as
+    a prepared statement.
+    """
+    query = f"""
+        INSERT INTO {table} ({', '.join(columns)})
+        VALUES ({', '.join(['%s'] * len(columns))})
+    """
+    count = 0
+    for row in rows(columns):
+        execute_prepared(cur, f"insert_{table}", query, row)
+        count += 1
+    return count
+
+def check_regions(cur):
+    """
+    Fail unless the regions table has chile_locations under the ids the
+    generator writes as demographics.region_id (position + 1).
+    """
+    cur.execute("SELECT id, state, city FROM regions ORDER BY id;")
+    expected = [(i, state, city) for i, (state, city) in enumerate(chile_locations, start=1)]
+    if cur.fetchall()[:len(expected)] != expected:
+        raise RuntimeError("regions in db_core_users does not match chile_locations in synthetic.py")
+
+def reserve_blocks(conn, n_users, append):
+    """
+    Empty the tables unless appending, then reserve the ids of n_users new
+    users and of their accounts. Returns (first user id, first account id).
+    """
+    total_accounts = sum(count for _, count in account_counts(n_users))
+    with conn.cursor() as cur:
+        check_regions(cur)
+        if not append:
+            truncate_tables(cur)
+        first_user_id = reserve_ids(cur, "users", n_users)
+        first_account_id = reserve_ids(cur, "accounts", total_accounts) if total_accounts else None
     conn.commit()
+    return first_user_id, first_account_id
+
+def insert_load(conn, n_users, generator, append=False):
+    """
+    Load n_users users (and their dependent rows) with one INSERT per row.
+    Suitable for small data sets; use copy_load for anything large. With
+    append=True the existing data is kept and the new users and accounts get
+    ids above it.
+    """
+    report = LoadReport()
+    first_user_id, next_account_id = reserve_blocks(conn, n_users, append)
+    last_user_id = first_user_id + n_users - 1
+    cur = conn.cursor()
 
     # -------------------------------
     # Insert Users and their Demographics
     # -------------------------------
-    for idx, user in enumerate(users_data, start=1):
-        # Insert into users table.
-        cur.execute(
-            "INSERT INTO users (name, email, phone) VALUES (%s, %s, %s);",
-            (user["name"], user["email"], user["phone"])
-        )
-        # Insert into demographics table.
-        cur.execute(
-            """
-            INSERT INTO demographics (user_id, age, gender, income_level, country, state, city)
-            VALUES (%s, %s, %s, %s, %s, %s, %s);
-            """,
-            (idx, user["age"], user["gender"], user["income_level"], "Chile", user["region"], user["city"])
-        )
-    conn.commit()
+    users, demographics = generator.users(first_user_id, n_users)
+    with report.track("users") as counter:
+        counter["rows"] = insert_rows(cur, "users", users)
+    with report.track("demographics") as counter:
+        counter["rows"] = insert_rows(cur, "demographics", demographics)
+    report.commit(conn)
 
     # -------------------------------
-    # Insert Onboarding for each User
+    # Insert Onboarding and User Status for each User
     # -------------------------------
-    for user_id in range(1, 101):
-        step = random.randint(1, 5)
-        status = 'completed' if random.random() > 0.5 else 'in_progress'
-        completed_at = datetime.now() if random.random() > 0.5 else None
-        cur.execute(
-            """
-            INSERT INTO onboarding (user_id, step, status, completed_at)
-            VALUES (%s, %s, %s, %s);
-            """,
-            (user_id, step, status, completed_at)
-        )
-    conn.commit()
+    user_ids = users["id"]
+    with report.track("onboarding") as counter:
+        counter["rows"] = insert_rows(cur, "onboarding", generator.onboarding(user_ids))
+    with report.track("user_status") as counter:
+        counter["rows"] = insert_rows(cur, "user_status", generator.user_status(user_ids))
+    report.commit(conn)
 
     # -------------------------------
-    # Insert User Status for each User
+    # Insert Accounts with required distribution, owned by the new users
     # -------------------------------
-    for user_id in range(1, 101):
-        status = 'active'
-        days_ago = random.randint(0, 30)
-        hours_ago = random.randint(0, 23)
-        minutes_ago = random.randint(0, 59)
-        last_active_at = datetime.now() - timedelta(days=days_ago, hours=hours_ago, minutes=minutes_ago)
-        cur.execute(
-            """
-            INSERT INTO user_status (user_id, status, last_active_at)
-            VALUES (%s, %s, %s);
-            """,
-            (user_id, status, last_active_at)
-        )
-    conn.commit()
+    card_account_ids = []
+    with report.track("accounts") as counter:
+        for account_type, count in account_counts(n_users):
+            accounts = generator.accounts(next_account_id, count, account_type, first_user_id, last_user_id)
+            next_account_id += count
+            counter["rows"] += insert_rows(cur, "accounts", accounts)
+            if account_type in CARD_ACCOUNT_TYPES:
+                card_account_ids.extend(accounts["id"].tolist())
+            report.commit(conn)
 
     # -------------------------------
-    # Insert Accounts with required distribution
+    # Insert Card_Info for accounts of type 'prepago' and 'credit_card'
     # -------------------------------
-    # Insert 50 accounts of type 'credit_card'
-    for _ in range(50):
-        user_id = random.randint(1, 100)
-        account_type = 'credit_card'
-        balance = round(random.uniform(0, 100000), 2)
-        currency = 'CLP'
-        activated_at = random_activation_date()
-        cur.execute(
-            """
-            INSERT INTO accounts (user_id, account_type, balance, currency, activated_at)
-            VALUES (%s, %s, %s, %s, %s);
-            """,
-            (user_id, account_type, balance, currency, activated_at)
-        )
-    conn.commit()
-
-    # Insert 100 accounts of type 'prepago'
-    for _ in range(100):
-        user_id = random.randint(1, 100)
-        account_type = 'prepago'
-        balance = round(random.uniform(0, 100000), 2)
-        currency = 'CLP'
-        activated_at = random_activation_date()
-        cur.execute(
-            """
-            INSERT INTO accounts (user_id, account_type, balance, currency, activated_at)
-            VALUES (%s, %s, %s, %s, %s);
-            """,
-            (user_id, account_type, balance, currency, activated_at)
-        )
-    conn.commit()
+    with report.track("card_info") as counter:
+        counter["rows"] = insert_rows(cur, "card_info", generator.cards(card_account_ids))
+    report.commit(conn)
 
-    # Insert 100 accounts of type 'savings'
-    for _ in range(100):
-        user_id = random.randint(1, 100)
-        account_type = 'savings'
-        balance = round(random.uniform(0, 100000), 2)
-        currency = 'CLP'
-        activated_at = random_activation_date()
-        cur.execute(
-            """
-            INSERT INTO accounts (user_id, account_type, balance, currency, activated_at)
-            VALUES (%s, %s, %s, %s, %s);
-            """,
-            (user_id, account_type, balance, currency, activated_at)
-        )
-    conn.commit()
+    cur.close()
+    return report
+
+def copy_load(conn, n_users, generator, chunk_size=COPY_CHUNK_ROWS, append=False):
+    """
+    Load n_users users (and their dependent rows) by streaming each table
+    through COPY FROM STDIN, chunk_size users/accounts at a time.
+
+    User and account ids are reserved up front as blocks of the serial
+    sequences (see reserve_ids) instead of being read back with RETURNING;
+    demographics, onboarding, user_status and card_info reference them
+    directly. Unless append=True, the tables are truncated first.
+    """
+    report = LoadReport()
+    first_user_id, next_account_id = reserve_blocks(conn, n_users, append)
+    last_user_id = first_user_id + n_users - 1
+    cur = conn.cursor()
 
-    # Insert 10 accounts of type 'paypal'
-    for _ in range(10):
-        user_id = random.randint(1, 100)
-        account_type = 'paypal'
-        balance = round(random.uniform(0, 100000), 2)
-        currency = 'CLP'
-        activated_at = random_activation_date()
-        cur.execute(
-            """
-            INSERT INTO accounts (user_id, account_type, balance, currency, activated_at)
-            VALUES (%s, %s, %s, %s, %s);
-            """,
-            (user_id, account_type, balance, currency, activated_at)
-        )
-    conn.commit()
+    def copy_table(table, columns):
+        with report.track(table) as counter:
+            copy_rows(cur, table, columns.keys(), rows(columns), chunk_size, counter)
 
     # -------------------------------
-    # Insert Card_Info for accounts of type 'prepago' and 'credit_card'
-    # Mask the card number with '***'
+    # Users, Demographics, Onboarding and User Status, one chunk at a time
     # -------------------------------
-    cur.execute("""
-        SELECT id FROM accounts 
-        WHERE account_type IN ('prepago', 'credit_card');
-    """)
-    eligible_accounts = cur.fetchall()  # List of tuples (id,)
+    for first_id in range(first_user_id, last_user_id + 1, chunk_size):
+        count = min(chunk_size, last_user_id + 1 - first_id)
+        users, demographics = generator.users(first_id, count)
+        copy_table("users", users)
+        copy_table("demographics", demographics)
+        copy_table("onboarding", generator.onboarding(users["id"]))
+        copy_table("user_status", generator.user_status(users["id"]))
+        report.commit(conn)
 
-    for (account_id,) in eligible_accounts:
-        card_number = '***'
-        # Generate an expiration date between 1 and 5 years in the future.
-        years_to_add = random.randint(1, 5)
-        expiration_date = (datetime.now() + timedelta(days=365 * years_to_add)).date()
-        status = 'active'
-        cur.execute(
-            """
-            INSERT INTO card_info (account_id, card_number, expiration_date, status)
-            VALUES (%s, %s, %s, %s);
-            """,
-            (account_id, card_number, expiration_date, status)
-        )
-    conn.commit()
+    # -------------------------------
+    # Accounts with required distribution, owned by the new users, plus
+    # Card_Info for card accounts
+    # -------------------------------
+    for account_type, remaining in account_counts(n_users):
+        while remaining:
+            count = min(chunk_size, remaining)
+            accounts = generator.accounts(next_account_id, count, account_type, first_user_id, last_user_id)
+            next_account_id += count
+            remaining -= count
+
+            copy_table("accounts", accounts)
+            if account_type in CARD_ACCOUNT_TYPES:
+                copy_table("card_info", generator.cards(accounts["id"]))
+            report.commit(conn)
 
-    # Close cursor and connection.
     cur.close()
-    conn.close()
-    print("Data ingestion complete.")
+    return report
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Seed db_core_users with synthetic Chilean users and accounts.")
+    parser.add_argument("--users", type=int, default=100,
+                        help="number of users to generate (default: 100)")
+    parser.add_argument("--mode", choices=["copy", "insert"], default="copy",
+                        help="copy streams rows with COPY FROM STDIN; insert issues one INSERT per row")
+    parser.add_argument("--chunk-size", type=int, default=COPY_CHUNK_ROWS,
+                        help="rows generated and copied per COPY statement (copy mode)")
+    parser.add_argument("--append", action="store_true",
+                        help="keep the existing data and add the new users and accounts on top of it")
+    parser.add_argument("--seed", type=int, default=None,
+                        help="seed for the synthetic data generator (default: random)")
+    telemetry.add_metrics_argument(parser)
+    args = parser.parse_args()
+    if args.users < 1:
+        parser.error("--users must be at least 1")
+    if args.chunk_size < 1:
+        parser.error("--chunk-size must be at least 1")
+    return args
+
+def main():
+    args = parse_args()
+    generator = SyntheticUsers(seed=args.seed)
+
+    # Connection settings come from config.py (overridable via environment).
+    with connection("core_users", bulk=True) as conn:
+        if args.mode == "copy":
+            report = copy_load(conn, args.users, generator, args.chunk_size, args.append)
+        else:
+            report = insert_load(conn, args.users, generator, args.append)
+
+    print(f"Data ingestion complete ({args.users} {'new ' if args.append else ''}users, {args.mode} mode).")
+    report.print()
+    if args.metrics:
+        telemetry.write_metrics(args.metrics, telemetry.collect(report))
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
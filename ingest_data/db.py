@@ -0,0 +1,211 @@
+import itertools
+import os
+import psycopg2
+import psycopg2.extensions
+import time
+from contextlib import contextmanager
+from psycopg2.pool import ThreadedConnectionPool
+
+from config import (BULK_SESSION_SETTINGS, POOL_MAX_CONNECTIONS, READ_REPLICAS, REPLICA_MAX_LAG_SECONDS, REPLICAS,
+                    connection_params)
+from telemetry import InstrumentedCursor, observe
+
+# Rows fetched per round trip by stream().
+STREAM_CHUNK_ROWS = 10000
+
+# Connection pools shared by every loader in a process, one per database.
+# Pools are keyed by process id as well, so a forked worker never reuses the
+# sockets of its parent.
+_pools = {}
+
+# Seconds a replica's measured lag (or failure to connect) is trusted before
+# read_connection() checks it again.
+REPLICA_CHECK_SECONDS = 1.0
+REPLICA_RETRY_SECONDS = 30.0
+
+# Last check of each replica, keyed like _pools: (checked_at, lag in seconds
+# and replayed LSN, or None when it was unreachable or not in recovery).
+_replica_checks = {}
+
+# Suffixes making server-side cursor names unique within a process.
+_cursor_ids = itertools.count(1)
+
+class IngestConnection(psycopg2.extensions.connection):
+    """
+    psycopg2 connection that remembers which statements it has prepared and
+    records every statement and commit in telemetry.py. Arrays of the
+    database's enums (e.g. merchant[]) are read as lists of strings, like
+    text[]; psycopg2 would otherwise return them as their text form.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prepared = set()
+        self.cursor_factory = InstrumentedCursor
+        with self.cursor() as cur:
+            cur.execute("SELECT typarray FROM pg_type WHERE typtype = 'e'")
+            enum_arrays = tuple(oid for (oid,) in cur.fetchall())
+        self.rollback()
+        if enum_arrays:
+            psycopg2.extensions.register_type(
+                psycopg2.extensions.new_array_type(enum_arrays, "ENUM_ARRAY", psycopg2.extensions.UNICODE), self)
+
+    def commit(self):
+        started = time.perf_counter()
+        super().commit()
+        observe(self.info.dbname, "commit", time.perf_counter() - started)
+
+def get_pool(name, replica=False):
+    """Return this process's connection pool for a database (or its replica), creating it on first use."""
+    key = (name, os.getpid(), replica)
+    if key not in _pools:
+        _pools[key] = ThreadedConnectionPool(1, POOL_MAX_CONNECTIONS,
+                                             connection_factory=IngestConnection,
+                                             **connection_params(name, replica))
+    return _pools[key]
+
+def close_pools():
+    """Close every pool opened by this process (e.g. before forking workers)."""
+    for key in [key for key in _pools if key[1] == os.getpid()]:
+        _pools.pop(key).closeall()
+
+@contextmanager
+def connection(name, bulk=False, replica=False):
+    """
+    Borrow a connection to a database from the pool. Committing is up to the
+    caller; anything left uncommitted is rolled back when the block exits.
+    With bulk=True the session runs with BULK_SESSION_SETTINGS
+    (synchronous_commit=off) for the duration of the block. replica=True
+    borrows from the database's replica instead; see read_connection().
+    """
+    pool = get_pool(name, replica)
+    conn = pool.getconn()
+    try:
+        if bulk:
+            with conn.cursor() as cur:
+                for setting, value in BULK_SESSION_SETTINGS.items():
+                    cur.execute(f"SET {setting} = %s", (value,))
+            conn.commit()
+        yield conn
+    finally:
+        discard = bool(conn.closed)
+        if not discard:
+            try:
+                conn.rollback()
+                if bulk:
+                    with conn.cursor() as cur:
+                        for setting in BULK_SESSION_SETTINGS:
+                            cur.execute(f"RESET {setting}")
+                    conn.commit()
+            except psycopg2.Error:
+                # The server went away: drop the connection and let the
+                # block's own exception, if any, propagate.
+                discard = True
+        pool.putconn(conn, close=discard)
+
+def lsn_value(lsn):
+    """Position of a WAL location ("16/B374D848") as an int, for comparisons."""
+    high, low = lsn.split("/")
+    return (int(high, 16) << 32) | int(low, 16)
+
+def current_lsn(conn):
+    """
+    The primary's current WAL location. Pass it to read_connection() as
+    min_lsn to read what conn has committed so far from a replica.
+    """
+    with conn.cursor() as cur:
+        cur.execute("SELECT pg_current_wal_lsn()::text")
+        lsn = cur.fetchone()[0]
+    conn.commit()
+    return lsn
+
+def check_replica(name):
+    """
+    Measure a replica's lag: (seconds behind the primary, replayed LSN), or
+    None when it is unreachable or no longer in recovery. A replica that is
+    streaming and has replayed everything it received counts as 0 s behind,
+    however long ago the primary last committed; one that lost its primary
+    is as far behind as its last replayed commit, and unavailable if it has
+    not replayed one since it started.
+    """
+    key = (name, os.getpid(), True)
+    try:
+        with connection(name, replica=True) as conn, conn.cursor() as cur:
+            cur.execute("""
+                SELECT pg_is_in_recovery(),
+                       CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn()
+                                 AND EXISTS (SELECT 1 FROM pg_stat_wal_receiver WHERE status = 'streaming') THEN 0
+                            ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())
+                       END,
+                       pg_last_wal_replay_lsn()::text
+            """)
+            in_recovery, lag, replayed = cur.fetchone()
+    except psycopg2.OperationalError:
+        # Drop the pool: its connections may point at a server that went away.
+        if key in _pools:
+            _pools.pop(key).closeall()
+        return None
+    if not in_recovery or replayed is None or lag is None:
+        return None
+    return float(lag), lsn_value(replayed)
+
+def replica_ready(name, max_lag, min_lsn=None):
+    """
+    Whether reads of a database may go to its replica: one is configured and
+    reachable, at most max_lag seconds behind and, if given, past min_lsn.
+    Checks are cached for REPLICA_CHECK_SECONDS (REPLICA_RETRY_SECONDS after
+    a failure); a cached check that is behind min_lsn is repeated.
+    """
+    if not READ_REPLICAS or name not in REPLICAS:
+        return False
+    key = (name, os.getpid())
+    now = time.monotonic()
+    checked_at, state = _replica_checks.get(key, (None, None))
+    expired = checked_at is None or now - checked_at >= (REPLICA_CHECK_SECONDS if state else REPLICA_RETRY_SECONDS)
+    if expired or (state and min_lsn is not None and state[1] < lsn_value(min_lsn)):
+        state = check_replica(name)
+        _replica_checks[key] = (now, state)
+    if state is None:
+        return False
+    lag, replayed = state
+    return lag <= max_lag and (min_lsn is None or replayed >= lsn_value(min_lsn))
+
+@contextmanager
+def read_connection(name, max_lag=REPLICA_MAX_LAG_SECONDS, min_lsn=None):
+    """
+    Borrow a connection for read-only queries: from the database's replica
+    (REPLICAS in config.py) when replica_ready() allows it, from the primary
+    otherwise. Pass min_lsn (see current_lsn()) to read your own writes.
+    """
+    with connection(name, replica=replica_ready(name, max_lag, min_lsn)) as conn:
+        yield conn
+
+def execute_prepared(cur, name, sql, params):
+    """
+    Execute sql (written with %s placeholders) as the server-side prepared
+    statement `name`, preparing it the first time it is used on the cursor's
+    connection. Repeated INSERTs then skip parsing and planning.
+    """
+    conn = cur.connection
+    if name not in conn.prepared:
+        parts = sql.split("%s")
+        numbered = "".join(part + (f"${i}" if i < len(parts) else "") for i, part in enumerate(parts, start=1))
+        cur.execute(f"PREPARE {name} AS {numbered}")
+        conn.prepared.add(name)
+    cur.execute(f"EXECUTE {name} ({', '.join(['%s'] * len(params))})", params)
+
+def stream(conn, query, params=None, chunk_size=STREAM_CHUNK_ROWS):
+    """
+    Run a query through a named (server-side) cursor and yield its rows in
+    lists of at most chunk_size, fetched one round trip per chunk, so client
+    memory stays flat however many rows the query returns. The connection
+    must not be committed until the generator is exhausted.
+    """
+    with conn.cursor(name=f"stream_{os.getpid()}_{next(_cursor_ids)}") as cur:
+        cur.itersize = chunk_size
+        cur.execute(query, params)
+        while True:
+            rows = cur.fetchmany(chunk_size)
+            if not rows:
+                break
+            yield rows
@@ -0,0 +1,191 @@
+import argparse
+import random
+import time
+from datetime import date, datetime
+from functools import lru_cache
+
+import numpy as np
+
+from db import connection, read_connection, stream
+
+# In-process campaign eligibility lookups for ml_metas. A user is eligible
+# for a campaign when their first credit_card account was activated before
+# the campaign start (the rule ml_metas.py materializes into user_campaigns);
+# a campaign applies on a day when the day falls within [start_date,
+# end_date], and to a merchant when the user's assignment lists it.
+#
+# Campaigns are kept sorted by start date with an interval index over their
+# [start, end] days: the days are cut at every campaign boundary into
+# segments during which the same campaigns run, and each segment lists them.
+# Activations are a sorted array of user ids with their activation day, and
+# assignments sorted (user_id, campaign_id) keys with a bitmask of their
+# merchants. A lookup is then a few binary searches plus the campaigns
+# running that day; answers are memoized in an LRU cache.
+
+# Lookups remembered by EligibilityIndex.applicable().
+CACHE_SIZE = 100000
+
+def day_number(day):
+    """Proleptic Gregorian ordinal of a date (or datetime)."""
+    return day.toordinal()
+
+class EligibilityIndex:
+    """Campaign eligibility of every credit_card user, loaded from DB_CORE_USERS and DB_ML_METAS."""
+
+    def __init__(self, cache_size=CACHE_SIZE):
+        self.merchant_bits = {}
+        self.applicable = lru_cache(maxsize=cache_size)(self._applicable)
+
+    def load(self, conn_users, conn_metas):
+        """(Re)load campaigns, activations and assignments, and clear the cache."""
+        with conn_metas.cursor() as cur:
+            cur.execute("SELECT id, start_date, end_date FROM campaigns ORDER BY start_date, id;")
+            campaigns = cur.fetchall()
+        self.campaign_ids = np.array([c[0] for c in campaigns], dtype=np.int32)
+        self.starts = np.array([day_number(c[1]) for c in campaigns], dtype=np.int32)
+        self.ends = np.array([day_number(c[2]) for c in campaigns], dtype=np.int32)
+        self.index_intervals()
+
+        activations = [(user_id, day_number(activated))
+                       for chunk in stream(conn_users, """
+                           SELECT user_id, MIN(activated_at)::date
+                           FROM accounts
+                           WHERE account_type = 'credit_card'
+                           GROUP BY user_id
+                           ORDER BY user_id;
+                       """)
+                       for user_id, activated in chunk]
+        self.user_ids = np.array([a[0] for a in activations], dtype=np.int32)
+        self.activated = np.array([a[1] for a in activations], dtype=np.int32)
+
+        keys, masks = [], []
+        for chunk in stream(conn_metas, "SELECT user_id, campaign_id, merchant_list FROM user_campaigns;"):
+            for user_id, campaign_id, merchant_list in chunk:
+                keys.append((user_id << 32) | campaign_id)
+                masks.append(self.merchant_mask(merchant_list or ()))
+        order = np.argsort(np.array(keys, dtype=np.int64), kind="stable")
+        self.assignment_keys = np.array(keys, dtype=np.int64)[order]
+        self.assignment_masks = np.array(masks, dtype=np.uint64)[order]
+
+        self.applicable.cache_clear()
+        return self
+
+    def merchant_mask(self, merchants):
+        """Bitmask of merchant names; every distinct merchant gets a bit on first sight."""
+        mask = 0
+        for merchant in merchants:
+            if merchant not in self.merchant_bits:
+                if len(self.merchant_bits) == 64:
+                    raise ValueError("more than 64 distinct merchants in merchant_list")
+                self.merchant_bits[merchant] = 1 << len(self.merchant_bits)
+            mask |= self.merchant_bits[merchant]
+        return mask
+
+    def index_intervals(self):
+        """
+        Build the interval index of the campaigns: segment boundaries (the
+        days some campaign starts or stops running) and, per segment, the
+        ascending indexes of its campaigns as slices of one array.
+        """
+        self.boundaries = np.unique(np.concatenate([self.starts, self.ends + 1]))
+        first = np.searchsorted(self.boundaries, self.starts)
+        last = np.searchsorted(self.boundaries, self.ends + 1)
+        lengths = last - first
+        campaigns = np.repeat(np.arange(len(self.starts)), lengths)
+        # Segment of each (campaign, segment) pair: first[campaign] plus its
+        # position within that campaign's run of segments.
+        segments = np.repeat(first, lengths) + np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+        order = np.lexsort((campaigns, segments))
+        self.segment_campaigns = campaigns[order]
+        self.segment_offsets = np.searchsorted(segments[order], np.arange(len(self.boundaries) + 1))
+
+    def active(self, day):
+        """Indexes (into the start-sorted campaigns) of the campaigns running on day."""
+        segment = np.searchsorted(self.boundaries, day, side="right") - 1
+        if segment < 0:
+            return self.segment_campaigns[:0]
+        return self.segment_campaigns[self.segment_offsets[segment]:self.segment_offsets[segment + 1]]
+
+    def _applicable(self, user_id, day, merchant=None):
+        """
+        Ids (ascending) of the campaigns that apply to user_id on day (a
+        date) and, if given, at merchant. Use applicable(), the cached version.
+        """
+        day = day_number(day)
+        position = np.searchsorted(self.user_ids, user_id)
+        if position == len(self.user_ids) or self.user_ids[position] != user_id:
+            return ()
+        candidates = self.active(day)
+        candidates = candidates[self.starts[candidates] > self.activated[position]]
+        if merchant is None or not len(candidates):
+            return tuple(sorted(self.campaign_ids[candidates].tolist()))
+
+        bit = self.merchant_bits.get(merchant)
+        if bit is None or not len(self.assignment_keys):
+            return ()
+        keys = (np.int64(user_id) << 32) | self.campaign_ids[candidates].astype(np.int64)
+        found = np.searchsorted(self.assignment_keys, keys).clip(max=len(self.assignment_keys) - 1)
+        assigned = self.assignment_keys[found] == keys
+        matches = assigned & ((self.assignment_masks[found] & np.uint64(bit)) != 0)
+        return tuple(sorted(self.campaign_ids[candidates[matches]].tolist()))
+
+def applicable_sql(conn, user_id, day, merchant):
+    """The SQL path for the same question, answered from user_campaigns (uses the merchant_list GIN index)."""
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT campaign_id FROM user_campaigns
+            WHERE user_id = %s AND start_date <= %s AND end_date >= %s AND merchant_list @> ARRAY[%s]::merchant[]
+            ORDER BY campaign_id;
+        """, (user_id, day, day, merchant))
+        return tuple(campaign_id for (campaign_id,) in cur.fetchall())
+
+def benchmark(index, lookups, seed=None):
+    """Time `lookups` random lookups, uncached then cached. Returns (cold, warm) microseconds per lookup."""
+    rng = random.Random(seed)
+    merchants = list(index.merchant_bits) or [None]
+    low, high = (int(index.starts.min()), int(index.ends.max())) if len(index.starts) else (0, 0)
+    queries = [(int(rng.choice(index.user_ids)), date.fromordinal(rng.randint(low, high)), rng.choice(merchants))
+               for _ in range(lookups)]
+
+    index.applicable.cache_clear()
+    timings = []
+    for _ in range(2):
+        started = time.perf_counter()
+        for query in queries:
+            index.applicable(*query)
+        timings.append((time.perf_counter() - started) / lookups * 1e6)
+    return tuple(timings)
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Answer campaign eligibility lookups from an in-memory index.")
+    parser.add_argument("--user-id", type=int, default=None,
+                        help="user to look up")
+    parser.add_argument("--date", type=lambda value: datetime.strptime(value, "%Y-%m-%d").date(), default=date.today(),
+                        help="day to look up, YYYY-MM-DD (default: today)")
+    parser.add_argument("--merchant", default=None,
+                        help="only campaigns whose assignment lists this merchant")
+    parser.add_argument("--benchmark", type=int, default=0,
+                        help="time this many random lookups (cold and cached)")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    started = time.perf_counter()
+    with read_connection("core_users") as conn_users, connection("ml_metas") as conn_metas:
+        index = EligibilityIndex().load(conn_users, conn_metas)
+        print(f"Loaded {len(index.campaign_ids):,} campaigns, {len(index.user_ids):,} users and "
+              f"{len(index.assignment_keys):,} assignments in {time.perf_counter() - started:.2f} s.")
+
+        if args.user_id is not None:
+            campaigns = index.applicable(args.user_id, args.date, args.merchant)
+            print(f"Campaigns for user {args.user_id} on {args.date}"
+                  f"{f' at {args.merchant}' if args.merchant else ''}: {list(campaigns)}")
+            if args.merchant:
+                print(f"SQL path: {list(applicable_sql(conn_metas, args.user_id, args.date, args.merchant))}")
+
+    if args.benchmark and len(index.user_ids):
+        cold, warm = benchmark(index, args.benchmark)
+        print(f"{args.benchmark:,} random lookups: {cold:.1f} us uncached, {warm:.1f} us cached per lookup.")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,252 @@
+import argparse
+import json
+import os
+import shutil
+from collections import defaultdict
+from datetime import datetime
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from db import STREAM_CHUNK_ROWS, connection, current_lsn, read_connection, stream
+
+# Export operations, accounts and user_campaigns to Parquet files for the
+# feature pipelines, so they read compact columnar files instead of querying
+# the OLTP instances. Rows are streamed through server-side cursors and
+# written as Hive-style monthly partitions:
+#
+#   <output>/<table>/month=YYYY-MM/part-<run>-<first id>-<last id>.parquet
+#
+# Every run only exports the rows whose id is above the one recorded for the
+# table in <output>/_export_state.json by the previous run (--full rewrites
+# the table from scratch in a staging directory, swapped in on success).
+# Files are written under hidden temporary names and renamed once the whole
+# table is exported, so readers never see a partial run and a failed run can
+# simply be repeated.
+
+# Hive's name for the partition of rows whose partition column is NULL.
+NULL_PARTITION = "__HIVE_DEFAULT_PARTITION__"
+
+# Rows buffered per month partition before a Parquet row group is written.
+ROW_GROUP_ROWS = 100000
+
+STATE_FILE = "_export_state.json"
+
+# database, columns (with their Arrow types) and the date or timestamp column
+# that decides the month partition of each exported table.
+EXPORTS = {
+    "operations": {
+        "database": "core_transactions",
+        "schema": pa.schema([
+            ("id", pa.int64()),
+            ("user_id", pa.int32()),
+            ("amount", pa.decimal128(15, 2)),
+            ("transaction_type", pa.string()),
+            ("merchant", pa.string()),
+            ("line_id", pa.int32()),
+            ("timestamp", pa.timestamp("us")),
+            ("status", pa.string())
+        ]),
+        "partition_by": "timestamp"
+    },
+    "accounts": {
+        "database": "core_users",
+        "schema": pa.schema([
+            ("id", pa.int32()),
+            ("user_id", pa.int32()),
+            ("account_type", pa.string()),
+            ("balance", pa.decimal128(15, 2)),
+            ("currency", pa.string()),
+            ("activated_at", pa.timestamp("us"))
+        ]),
+        "partition_by": "activated_at"
+    },
+    "user_campaigns": {
+        "database": "ml_metas",
+        "schema": pa.schema([
+            ("id", pa.int32()),
+            ("user_id", pa.int32()),
+            ("campaign_id", pa.int32()),
+            ("merchant_list", pa.list_(pa.string())),
+            ("start_date", pa.date32()),
+            ("end_date", pa.date32())
+        ]),
+        "partition_by": "start_date"
+    }
+}
+
+def load_state(output):
+    """Return {table: last exported id} from the output directory (empty on the first run)."""
+    path = os.path.join(output, STATE_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+def save_state(output, state):
+    """Write the export state atomically, so an interrupted run leaves the previous one intact."""
+    path = os.path.join(output, STATE_FILE)
+    with open(path + ".tmp", "w") as f:
+        json.dump(state, f, indent=2)
+    os.replace(path + ".tmp", path)
+
+def high_water_mark(conn, table):
+    """
+    Return the table's current max id. The SHARE lock waits for in-flight
+    writers to commit, so no row at or below the returned id can appear later.
+    """
+    with conn.cursor() as cur:
+        cur.execute(f"LOCK TABLE {table} IN SHARE MODE;")
+        cur.execute(f"SELECT MAX(id) FROM {table};")
+        high = cur.fetchone()[0]
+    conn.commit()
+    return high
+
+class PartitionWriter:
+    """
+    Parquet writers for the month partitions of one table in one run, opened
+    on first use. Rows are buffered per month and written ROW_GROUP_ROWS at
+    a time; the files only get their final names on close().
+    """
+
+    def __init__(self, root, schema, run_id, low, high):
+        self.root = root
+        self.schema = schema
+        self.file_name = f"part-{run_id}-{low + 1}-{high}.parquet"
+        self.writers = {}
+        self.buffers = defaultdict(list)
+        self.files = []
+
+    def add(self, month, row):
+        buffer = self.buffers[month]
+        buffer.append(row)
+        if len(buffer) >= ROW_GROUP_ROWS:
+            self.flush(month)
+
+    def flush(self, month):
+        buffer = self.buffers.pop(month, None)
+        if not buffer:
+            return
+        if month not in self.writers:
+            directory = os.path.join(self.root, f"month={month}")
+            os.makedirs(directory, exist_ok=True)
+            path = os.path.join(directory, self.file_name)
+            self.writers[month] = pq.ParquetWriter(self.temporary(path), self.schema, compression="zstd")
+            self.files.append(path)
+        columns = [pa.array(values, type=field.type) for values, field in zip(zip(*buffer), self.schema)]
+        self.writers[month].write_table(pa.Table.from_arrays(columns, schema=self.schema))
+
+    @staticmethod
+    def temporary(path):
+        # Parquet readers skip files whose name starts with a dot.
+        return os.path.join(os.path.dirname(path), "." + os.path.basename(path) + ".tmp")
+
+    def close(self):
+        """Flush every buffer, close the files and give them their final names."""
+        for month in list(self.buffers):
+            self.flush(month)
+        for writer in self.writers.values():
+            writer.close()
+        for path in self.files:
+            os.replace(self.temporary(path), path)
+        return self.files
+
+    def abort(self):
+        """Close and delete the files written so far."""
+        for writer in self.writers.values():
+            writer.close()
+        for path in self.files:
+            os.remove(self.temporary(path))
+
+def export_table(table, output, low, run_id, chunk_size=STREAM_CHUNK_ROWS):
+    """
+    Export the rows of table with an id above low. Returns the new last
+    exported id, the number of rows and the files written. The high-water
+    mark is taken on the primary; the rows are read from the database's
+    replica once it has replayed that far.
+    """
+    spec = EXPORTS[table]
+    with connection(spec["database"]) as conn:
+        high = high_water_mark(conn, table)
+        min_lsn = current_lsn(conn)
+    if high is None or high <= low:
+        return low, 0, []
+
+    with read_connection(spec["database"], min_lsn=min_lsn) as conn:
+        schema = spec["schema"]
+        partition_index = schema.get_field_index(spec["partition_by"])
+        writer = PartitionWriter(os.path.join(output, table), schema, run_id, low, high)
+        exported = 0
+        try:
+            for chunk in stream(conn, f"SELECT {', '.join(schema.names)} FROM {table} WHERE id > %s AND id <= %s",
+                                (low, high), chunk_size):
+                for row in chunk:
+                    value = row[partition_index]
+                    writer.add(NULL_PARTITION if value is None else value.strftime("%Y-%m"), row)
+                exported += len(chunk)
+        except BaseException:
+            writer.abort()
+            raise
+    return high, exported, writer.close()
+
+def export_full(table, output, run_id, chunk_size=STREAM_CHUNK_ROWS):
+    """
+    Export every row of table into a hidden staging directory under output,
+    then swap it in for the table's directory. A failed export or swap
+    leaves the previous files (and their recorded id) in place; they are
+    only deleted once the new ones are. Returns what export_table() does.
+    """
+    staging = os.path.join(output, f".full-{table}-{run_id}")
+    target = os.path.join(output, table)
+    previous = os.path.join(staging, "previous")
+    try:
+        high, exported, files = export_table(table, staging, 0, run_id, chunk_size)
+        exported_root = os.path.join(staging, table)
+        os.makedirs(exported_root, exist_ok=True)
+        replacing = os.path.exists(target)
+        if replacing:
+            os.replace(target, previous)
+        try:
+            os.replace(exported_root, target)
+        except BaseException:
+            if replacing:
+                os.replace(previous, target)
+            raise
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+    return high, exported, [os.path.join(target, os.path.relpath(path, exported_root)) for path in files]
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Export operations, accounts and user_campaigns to monthly partitioned Parquet files.")
+    parser.add_argument("--output", default="export",
+                        help="root directory of the Parquet dataset (default: ./export)")
+    parser.add_argument("--tables", nargs="+", choices=list(EXPORTS), default=list(EXPORTS))
+    parser.add_argument("--full", action="store_true",
+                        help="replace the exported tables with every row instead of adding those since the last export")
+    parser.add_argument("--chunk-size", type=int, default=STREAM_CHUNK_ROWS,
+                        help=f"rows fetched per round trip (default: {STREAM_CHUNK_ROWS})")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    os.makedirs(args.output, exist_ok=True)
+    state = load_state(args.output)
+    run_id = datetime.now().strftime("%Y%m%dT%H%M%S")
+
+    for table in args.tables:
+        low = 0 if args.full else state.get(table, 0)
+        if args.full:
+            high, exported, files = export_full(table, args.output, run_id, args.chunk_size)
+        else:
+            high, exported, files = export_table(table, args.output, low, run_id, args.chunk_size)
+        state[table] = high
+        # Record progress per table, so a failure later in the run keeps it.
+        save_state(args.output, state)
+        if exported:
+            print(f"  {table:<16} {exported:>12,} rows (ids {low + 1:,}-{high:,}) in {len(files)} files")
+        else:
+            print(f"  {table:<16} nothing new since id {low:,}")
+
+if __name__ == '__main__':
+    main()
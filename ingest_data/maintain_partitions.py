@@ -0,0 +1,40 @@
+import argparse
+from datetime import datetime, timedelta
+
+from core_transactions import ensure_partitions
+from db import connection
+
+def drop_old_partitions(conn, keep_months):
+    """
+    Detach and drop the monthly partitions older than keep_months months
+    (see drop_old_partitions() in init.sql). Returns the number dropped.
+    """
+    with conn.cursor() as cur:
+        cur.execute("SELECT drop_old_partitions(%s);", (keep_months,))
+        dropped = cur.fetchone()[0]
+    conn.commit()
+    return dropped
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Create upcoming monthly partitions in db_core_transactions and drop expired ones. "
+                    "Meant to be run periodically (e.g. daily from cron).")
+    parser.add_argument("--ahead", type=int, default=3,
+                        help="months of future partitions to keep ready (default: 3)")
+    parser.add_argument("--keep", type=int, default=None,
+                        help="retention in months; older partitions are detached and dropped (default: keep all)")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    with connection("core_transactions") as conn:
+        now = datetime.now()
+        created = ensure_partitions(conn, now, now + timedelta(days=31 * args.ahead))
+        print(f"Created {created} partitions.")
+
+        if args.keep is not None:
+            dropped = drop_old_partitions(conn, args.keep)
+            print(f"Dropped {dropped} partitions older than {args.keep} months.")
+
+if __name__ == '__main__':
+    main()
@@ -1,108 +1,209 @@
-import psycopg2
+import argparse
+import itertools
 import random
 from datetime import datetime, timedelta
+from psycopg2.extras import execute_values
 
-# List of merchants to choose from
-MERCHANTS = ["Amazon", "Walmart", "BestBuy", "Target", "Starbucks"]
+import telemetry
+from bulk import LoadReport, copy_rows
+from db import connection, current_lsn, read_connection, stream
+from synthetic import MERCHANTS
 
-def random_date_between(start, end):
-    """Return a random date between start and end (both datetime.date objects)."""
+# Earliest activation date of every credit_card user in DB_CORE_USERS.
+CREDIT_CARD_ACTIVATIONS_SQL = """
+    SELECT user_id, MIN(activated_at)::date
+    FROM accounts
+    WHERE account_type = 'credit_card'
+    GROUP BY user_id
+"""
+
+def random_date_between(rng, start, end):
+    """Return a random date between start and end (both datetime.date objects) drawn from rng."""
     delta_days = (end - start).days
-    random_days = random.randint(0, delta_days)
+    random_days = rng.randint(0, delta_days)
     return start + timedelta(days=random_days)
 
-def main():
-    # Connection parameters for DB_CORE_USERS (where accounts live)
-    conn_users = psycopg2.connect(
-        host="localhost",
-        port=5432,
-        dbname="core_users",
-        user="postgres",
-        password="postgres"
-    )
-    cur_users = conn_users.cursor()
-    
-    # Connection parameters for DB_ML_METAS (where campaigns will be inserted)
-    conn_metas = psycopg2.connect(
-        host="localhost",
-        port=5434,  # as defined in your docker-compose
-        dbname="ml_metas",
-        user="postgres",
-        password="postgres"
-    )
-    cur_metas = conn_metas.cursor()
-    
-    # ------------------------------------------------------------------
-    # Retrieve all credit_card accounts with their activation dates.
-    # We'll assume the accounts table contains a non-null activated_at column.
-    # ------------------------------------------------------------------
-    cur_users.execute("""
-        SELECT user_id, activated_at
-        FROM accounts
-        WHERE account_type = 'credit_card';
+def stage_credit_card_users(conn_users, cur_metas, counter=None):
+    """
+    Copy every credit_card user's activation date from DB_CORE_USERS into a
+    temporary credit_card_users table in DB_ML_METAS, so eligibility can be
+    joined server-side. Rows are streamed through a server-side cursor
+    straight into COPY, so memory stays flat. Users with several credit_card
+    accounts are eligible from their earliest activation. Returns the number
+    of users staged (also added to counter, a LoadReport.track dict, if given).
+    """
+    chunks = stream(conn_users, CREDIT_CARD_ACTIVATIONS_SQL)
+    cur_metas.execute("""
+        CREATE TEMPORARY TABLE credit_card_users (
+            user_id INTEGER PRIMARY KEY,
+            activated_date DATE
+        ) ON COMMIT PRESERVE ROWS;
     """)
-    accounts = cur_users.fetchall()  # list of tuples (user_id, activated_at)
-    
-    # Create a dictionary mapping user_id to activation_date (as a date)
-    credit_card_users = {user_id: activated_at.date() for user_id, activated_at in accounts}
-    print(f"Found {len(credit_card_users)} credit_card users.")
-    
-    # ------------------------------------------------------------------
-    # For a clean slate in DB_ML_METAS, truncate the campaigns and user_campaigns tables.
-    # ------------------------------------------------------------------
-    cur_metas.execute("TRUNCATE TABLE user_campaigns, campaigns RESTART IDENTITY CASCADE;")
-    conn_metas.commit()
-    
+    staged = copy_rows(cur_metas, "credit_card_users", ("user_id", "activated_date"),
+                       itertools.chain.from_iterable(chunks), counter=counter)
+    cur_metas.execute("CREATE INDEX ON credit_card_users (activated_date);")
+    cur_metas.execute("ANALYZE credit_card_users;")
+    return staged
+
+def generate_campaigns(total_campaigns, seed=None):
+    """
+    Return total_campaigns (name, goal, cashback_percentage, start_date,
+    end_date) tuples starting within the past 2 years and lasting 14-90 days.
+    The same seed gives the same campaigns on the same day.
+    """
+    rng = random.Random(seed)
     # Set up the 2-year window for campaign start dates.
     today = datetime.now().date()
     two_years_ago = today - timedelta(days=365 * 2)
-    
-    total_campaigns = 50
+
+    campaigns = []
     for i in range(total_campaigns):
         campaign_name = f"Campaign {i+1}"
         # Random goal and cashback percentage.
-        goal = round(random.uniform(1000, 50000), 2)
-        cashback_percentage = round(random.uniform(1, 20), 2)
-        
+        goal = round(rng.uniform(1000, 50000), 2)
+        cashback_percentage = round(rng.uniform(1, 20), 2)
+
         # Choose a campaign start_date randomly from the past 2 years.
-        campaign_start = random_date_between(two_years_ago, today)
+        campaign_start = random_date_between(rng, two_years_ago, today)
         # Campaign duration: random between 14 and 90 days.
-        duration_days = random.randint(14, 90)
+        duration_days = rng.randint(14, 90)
         campaign_end = campaign_start + timedelta(days=duration_days)
-        
-        # Insert the campaign record.
-        cur_metas.execute(
-            """
-            INSERT INTO campaigns (name, goal, cashback_percentage, start_date, end_date)
-            VALUES (%s, %s, %s, %s, %s)
-            RETURNING id;
-            """,
-            (campaign_name, goal, cashback_percentage, campaign_start, campaign_end)
-        )
-        campaign_id = cur_metas.fetchone()[0]
-        conn_metas.commit()
-        
-        # For each credit_card user, assign the campaign if the account was activated before campaign start.
-        for user_id, activated_date in credit_card_users.items():
-            if activated_date < campaign_start:
-                # Choose one random merchant for the campaign assignment.
-                merchant_list = [random.choice(MERCHANTS)]
-                cur_metas.execute(
-                    """
-                    INSERT INTO user_campaigns (user_id, campaign_id, merchant_list, start_date, end_date)
-                    VALUES (%s, %s, %s, %s, %s);
-                    """,
-                    (user_id, campaign_id, merchant_list, campaign_start, campaign_end)
-                )
-        conn_metas.commit()
-    
-    print(f"Inserted {total_campaigns} campaigns and assigned eligible credit_card users to each campaign.")
-    
-    # Close all cursors and connections.
-    cur_users.close()
-    conn_users.close()
-    cur_metas.close()
-    conn_metas.close()
+        campaigns.append((campaign_name, goal, cashback_percentage, campaign_start, campaign_end))
+    return campaigns
+
+def assign_campaigns(cur_metas, campaign_ids, after_user_id=0):
+    """
+    Assign the given campaigns to every staged credit_card user (with an id
+    above after_user_id) whose account was activated before the campaign
+    start, in a single INSERT ... SELECT. Each assignment gets one random
+    merchant; pairs already assigned are skipped. Returns the number of rows
+    inserted.
+    """
+    cur_metas.execute(
+        """
+        INSERT INTO user_campaigns (user_id, campaign_id, merchant_list, start_date, end_date)
+        SELECT u.user_id, c.id,
+               ARRAY[(%(merchants)s::merchant[])[1 + floor(random() * %(n_merchants)s)::int]],
+               c.start_date, c.end_date
+        FROM campaigns c
+        JOIN credit_card_users u ON u.activated_date < c.start_date
+        WHERE c.id = ANY(%(campaign_ids)s) AND u.user_id > %(after_user_id)s
+        ON CONFLICT (user_id, campaign_id) DO NOTHING;
+        """,
+        {"merchants": MERCHANTS, "n_merchants": len(MERCHANTS), "campaign_ids": campaign_ids,
+         "after_user_id": after_user_id}
+    )
+    return cur_metas.rowcount
+
+def load_campaigns(conn_users, conn_metas, total_campaigns, campaigns_per_batch, append=False, seed=None):
+    """
+    Replace the campaigns in DB_ML_METAS and assign them to eligible
+    credit_card users. Returns a LoadReport. With a seed, the campaigns and
+    the merchant drawn for each assignment are reproducible.
+
+    With append=True the existing campaigns are kept: the new campaigns are
+    assigned to every eligible user, and the existing ones to the users added
+    since (ids above the highest user already assigned; users are only ever
+    appended with higher ids, and a lower-id user left out before is still
+    ineligible since neither the campaigns nor the activations changed).
+    """
+    report = LoadReport()
+    cur_metas = conn_metas.cursor()
+
+    # ------------------------------------------------------------------
+    # For a clean slate in DB_ML_METAS, truncate the campaigns and user_campaigns
+    # tables; when appending, note the existing campaigns and highest user instead.
+    # ------------------------------------------------------------------
+    if append:
+        cur_metas.execute("SELECT id FROM campaigns ORDER BY id;")
+        existing_ids = [campaign_id for (campaign_id,) in cur_metas.fetchall()]
+        cur_metas.execute("SELECT COALESCE(MAX(user_id), 0) FROM user_campaigns;")
+        last_user_id = cur_metas.fetchone()[0]
+    else:
+        cur_metas.execute("TRUNCATE TABLE user_campaigns, campaigns RESTART IDENTITY CASCADE;")
+        existing_ids, last_user_id = [], 0
+    conn_metas.commit()
+
+    try:
+        # ------------------------------------------------------------------
+        # Stage the credit_card users' activation dates in DB_ML_METAS once.
+        # ------------------------------------------------------------------
+        with report.track("credit_card_users") as counter:
+            staged = stage_credit_card_users(conn_users, cur_metas, counter)
+            report.commit(conn_metas)
+        print(f"Found {staged} credit_card users.")
+
+        # ------------------------------------------------------------------
+        # Insert the campaigns, then assign them batch by batch with set-based
+        # INSERT ... SELECT statements joining on the activation date.
+        # ------------------------------------------------------------------
+        with report.track("campaigns") as counter:
+            campaign_ids = [row[0] for row in execute_values(
+                cur_metas,
+                """
+                INSERT INTO campaigns (name, goal, cashback_percentage, start_date, end_date)
+                VALUES %s
+                RETURNING id;
+                """,
+                generate_campaigns(total_campaigns, seed),
+                fetch=True
+            )]
+            counter["rows"] = len(campaign_ids)
+            report.commit(conn_metas)
+
+        if seed is not None:
+            # assign_campaigns() picks each merchant with the server-side random().
+            cur_metas.execute("SELECT setseed(%s);", ((seed % 2**31) / 2**31,))
+        for ids, after_user_id in ((existing_ids, last_user_id), (campaign_ids, 0)):
+            for start in range(0, len(ids), campaigns_per_batch):
+                with report.track("user_campaigns") as counter:
+                    counter["rows"] = assign_campaigns(cur_metas, ids[start:start + campaigns_per_batch], after_user_id)
+                    report.commit(conn_metas)
+
+        assigned = report.tables.get("user_campaigns", {"rows": 0})["rows"]
+        print(f"Inserted {len(campaign_ids)} campaigns and assigned eligible credit_card users to each campaign ({assigned} assignments).")
+    finally:
+        # Drop credit_card_users even when the load failed, or the next load
+        # borrowing this pooled connection could not create it again.
+        if not conn_metas.closed:
+            conn_metas.rollback()
+            cur_metas.execute("DROP TABLE IF EXISTS credit_card_users;")
+            conn_metas.commit()
+        cur_metas.close()
+    return report
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Create campaigns in db_ml_metas and assign eligible credit_card users.")
+    parser.add_argument("--campaigns", type=int, default=50,
+                        help="number of campaigns to create (default: 50)")
+    parser.add_argument("--campaigns-per-batch", type=int, default=100,
+                        help="campaigns assigned per INSERT ... SELECT statement (default: 100)")
+    parser.add_argument("--append", action="store_true",
+                        help="keep the existing campaigns, add new ones and assign users added since the last run")
+    parser.add_argument("--seed", type=int, default=None,
+                        help="seed for the campaigns and their merchant assignments (default: random)")
+    telemetry.add_metrics_argument(parser)
+    args = parser.parse_args()
+    if args.campaigns < 1:
+        parser.error("--campaigns must be at least 1")
+    if args.campaigns_per_batch < 1:
+        parser.error("--campaigns-per-batch must be at least 1")
+    return args
+
+def main():
+    args = parse_args()
+
+    # Connections to DB_CORE_USERS (where accounts live; read from its replica
+    # once it has every account) and DB_ML_METAS (where campaigns will be
+    # inserted); settings come from config.py.
+    with connection("core_users") as conn_users:
+        users_lsn = current_lsn(conn_users)
+    with read_connection("core_users", min_lsn=users_lsn) as conn_users, connection("ml_metas", bulk=True) as conn_metas:
+        report = load_campaigns(conn_users, conn_metas, args.campaigns, args.campaigns_per_batch, args.append,
+                                args.seed)
+    report.print()
+    if args.metrics:
+        telemetry.write_metrics(args.metrics, telemetry.collect(report))
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
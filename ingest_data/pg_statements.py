@@ -0,0 +1,87 @@
+import argparse
+
+from config import DATABASES
+from db import connection
+from telemetry import statement_kind
+
+# Server-side view of the loaders' statements from pg_stat_statements, which
+# every image preloads (see postgres/profiles/common.conf). Statements are
+# classified with telemetry.statement_kind(), so they can be joined with the
+# client-side statistics by telemetry.correlate().
+
+# Statements kept per database, by total time.
+TOP_STATEMENTS = 10
+
+def has_server_statements(cur):
+    """Whether pg_stat_statements is installed in the cursor's database."""
+    cur.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_stat_statements'")
+    return cur.fetchone() is not None
+
+def reset_server_statements(conn):
+    """Clear pg_stat_statements, if installed. Returns whether it was."""
+    with conn.cursor() as cur:
+        installed = has_server_statements(cur)
+        if installed:
+            cur.execute("SELECT pg_stat_statements_reset()")
+    conn.commit()
+    return installed
+
+def server_statements(conn, limit=TOP_STATEMENTS):
+    """
+    Top-level statements of the connection's database from pg_stat_statements,
+    most total execution time first (all of them if limit is None). Returns
+    a list of dicts, or None when the extension is not installed.
+    """
+    with conn.cursor() as cur:
+        if not has_server_statements(cur):
+            conn.commit()
+            return None
+        cur.execute("""
+            SELECT query, calls, rows, total_exec_time, mean_exec_time,
+                   shared_blks_hit, shared_blks_read, wal_bytes
+            FROM pg_stat_statements
+            WHERE dbid = (SELECT oid FROM pg_database WHERE datname = current_database()) AND toplevel
+            ORDER BY total_exec_time DESC
+            LIMIT %s
+        """, (limit,))
+        results = cur.fetchall()
+    conn.commit()
+    return [{
+        "statement": statement_kind(query),
+        "query": " ".join(query.split()),
+        "calls": calls,
+        "rows": rows,
+        "total_ms": round(total, 3),
+        "mean_ms": round(mean, 3),
+        "shared_blks_hit": hit,
+        "shared_blks_read": read,
+        "wal_bytes": int(wal_bytes)
+    } for query, calls, rows, total, mean, hit, read, wal_bytes in results]
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Show or reset pg_stat_statements on the three databases.")
+    parser.add_argument("--reset", action="store_true",
+                        help="clear pg_stat_statements instead of showing it")
+    parser.add_argument("--top", type=int, default=TOP_STATEMENTS,
+                        help=f"statements shown per database (default: {TOP_STATEMENTS})")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    for database in DATABASES:
+        with connection(database) as conn:
+            if args.reset:
+                installed = reset_server_statements(conn)
+                print(f"{database}: {'reset' if installed else 'pg_stat_statements is not installed'}")
+                continue
+            statements = server_statements(conn, args.top)
+        if statements is None:
+            print(f"{database}: pg_stat_statements is not installed")
+            continue
+        print(f"{database}:")
+        for statement in statements:
+            print(f"  {statement['statement']:<40} {statement['calls']:>9,} calls  {statement['rows']:>12,} rows  "
+                  f"{statement['total_ms'] / 1000:>9.2f} s  mean {statement['mean_ms']:>9.2f} ms")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,128 @@
+import argparse
+from datetime import date, timedelta
+
+from db import connection, current_lsn, read_connection
+
+# Read API over user_daily_rollups in db_core_transactions (per user and day:
+# settled operations and amount by transaction type and merchant; declined
+# payments and pending transfers are not counted), for dashboards
+# that would otherwise aggregate the raw operations rows. The rollups are
+# brought up to date with refresh_rollups(), which the transactions loader
+# and the traffic simulator call after refreshing operations. Reads go to the
+# core_transactions replica when it is up to date.
+
+SPEND_TYPES = ("mastercard", "paypal")
+INTERNAL_TYPES = ("internal_send", "internal_receive")
+
+def refresh_rollups(conn):
+    """
+    Fold the operations added since the last refresh into user_daily_rollups
+    (see refresh_user_daily_rollups() in init.sql). Returns the number of
+    rollup rows inserted or updated.
+    """
+    with conn.cursor() as cur:
+        cur.execute("SELECT refresh_user_daily_rollups();")
+        updated = cur.fetchone()[0]
+    conn.commit()
+    return updated
+
+def daily_spend(conn, user_id, start, end):
+    """
+    Card and paypal spend of one user per day in [start, end]. Returns
+    (day, transaction_type, merchant, operations, amount) tuples by day.
+    """
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT day, transaction_type, merchant, operations, amount
+            FROM user_daily_rollups
+            WHERE user_id = %s AND day BETWEEN %s AND %s AND transaction_type IN %s
+            ORDER BY day, transaction_type, merchant;
+        """, (user_id, start, end, SPEND_TYPES))
+        return cur.fetchall()
+
+def spend_by_merchant(conn, user_id, start, end):
+    """
+    Total spend of one user per merchant over [start, end]. Returns
+    (merchant, operations, amount) tuples, largest amount first.
+    """
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT merchant, sum(operations), sum(amount)
+            FROM user_daily_rollups
+            WHERE user_id = %s AND day BETWEEN %s AND %s AND transaction_type IN %s
+            GROUP BY merchant
+            ORDER BY 3 DESC;
+        """, (user_id, start, end, SPEND_TYPES))
+        return cur.fetchall()
+
+def internal_flow(conn, user_id, start, end):
+    """
+    Internal transfers of one user per day in [start, end]. Returns
+    (day, sent, received, net) tuples; sent is negative.
+    """
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT day,
+                   COALESCE(sum(amount) FILTER (WHERE transaction_type = 'internal_send'), 0),
+                   COALESCE(sum(amount) FILTER (WHERE transaction_type = 'internal_receive'), 0),
+                   sum(amount)
+            FROM user_daily_rollups
+            WHERE user_id = %s AND day BETWEEN %s AND %s AND transaction_type IN %s
+            GROUP BY day
+            ORDER BY day;
+        """, (user_id, start, end, INTERNAL_TYPES))
+        return cur.fetchall()
+
+def top_merchants(conn, start, end, limit=10):
+    """
+    Merchants with the largest spend across all users over [start, end].
+    Returns (merchant, users, operations, amount) tuples.
+    """
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT merchant, count(DISTINCT user_id), sum(operations), sum(amount)
+            FROM user_daily_rollups
+            WHERE day BETWEEN %s AND %s AND transaction_type IN %s
+            GROUP BY merchant
+            ORDER BY 4 DESC
+            LIMIT %s;
+        """, (start, end, SPEND_TYPES, limit))
+        return cur.fetchall()
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Refresh and read the per-user daily rollups in db_core_transactions.")
+    parser.add_argument("--refresh", action="store_true",
+                        help="fold the operations added since the last refresh into the rollups first")
+    parser.add_argument("--user-id", type=int, default=None,
+                        help="print the spend and internal flow of this user (default: top merchants)")
+    parser.add_argument("--days", type=int, default=30,
+                        help="number of days up to today to report on (default: 30)")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    end = date.today()
+    start = end - timedelta(days=args.days - 1)
+
+    min_lsn = None
+    if args.refresh:
+        with connection("core_transactions") as conn:
+            print(f"Refreshed {refresh_rollups(conn):,} rollup rows.")
+            min_lsn = current_lsn(conn)
+
+    with read_connection("core_transactions", min_lsn=min_lsn) as conn:
+        if args.user_id is None:
+            print(f"Top merchants from {start} to {end}:")
+            for merchant, users, operations, amount in top_merchants(conn, start, end):
+                print(f"  {merchant:<16} {users:>10,} users  {operations:>12,} operations  {amount:>16,.2f}")
+            return
+
+        print(f"Spend of user {args.user_id} by merchant from {start} to {end}:")
+        for merchant, operations, amount in spend_by_merchant(conn, args.user_id, start, end):
+            print(f"  {merchant:<16} {operations:>8,} operations  {amount:>14,.2f}")
+        print("Internal transfers by day:")
+        for day, sent, received, net in internal_flow(conn, args.user_id, start, end):
+            print(f"  {day}  sent {sent:>12,.2f}  received {received:>12,.2f}  net {net:>12,.2f}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,394 @@
+import argparse
+import asyncio
+import io
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import aclosing
+from datetime import datetime, timedelta
+
+import asyncpg
+
+from bulk import COPY_CHUNK_ROWS, LoadReport, copy_text
+from config import BULK_SESSION_SETTINGS, POOL_MAX_CONNECTIONS, connection_params
+from core_transactions import INTERNAL_ACCOUNT_TYPES, MASTERCARD_ACCOUNT_TYPES, PAYPAL_ACCOUNT_TYPES
+from ml_metas import generate_campaigns
+from synthetic import (CARD_ACCOUNT_TYPES, INTERNAL_PER_SAVINGS_ACCOUNT, MASTERCARD_AMOUNTS, MERCHANTS,
+                       PAYPAL_AMOUNTS, SyntheticTransactions, SyntheticUsers, account_counts, rows)
+
+# Seeds all three databases from one asyncio event loop (asyncpg). core_users
+# is loaded first; transactions and campaigns, which only read from it, are
+# then generated concurrently against their own servers, so the wall time is
+# close to that of the slowest database instead of the sum of the three.
+#
+# Each stream is a pipeline: a producer hands generation and COPY encoding of
+# a batch to a process pool, a bounded queue holds the batches in flight, and
+# writer tasks COPY them, one transaction per batch, over pooled connections.
+
+# Encoded batches waiting for a writer, per pipeline.
+QUEUE_SIZE = 4
+
+# Writer tasks (and so connections) per pipeline.
+WRITERS = 2
+
+ASSIGN_CAMPAIGNS_SQL = """
+    INSERT INTO user_campaigns (user_id, campaign_id, merchant_list, start_date, end_date)
+    SELECT u.user_id, c.id,
+           ARRAY[($1::merchant[])[1 + floor(random() * $2)::int]],
+           c.start_date, c.end_date
+    FROM campaigns c
+    JOIN credit_card_users u ON u.activated_date < c.start_date
+    WHERE c.id = ANY($3);
+"""
+
+async def create_pool(name, bulk=False):
+    """Open an asyncpg pool for a database from config.py, with BULK_SESSION_SETTINGS if bulk."""
+    params = connection_params(name)
+    params["database"] = params.pop("dbname")
+    params["port"] = int(params["port"])
+    return await asyncpg.create_pool(min_size=1, max_size=POOL_MAX_CONNECTIONS,
+                                     server_settings=dict(BULK_SESSION_SETTINGS) if bulk else None,
+                                     **params)
+
+# ----------------------------------------------------------------------
+# Batch generation, run in the process pool. Each returns a list of
+# (table, columns, COPY text bytes, row count) loaded in one transaction.
+# Every batch has its own generator seeded from the run seed and its first
+# id, so a run is reproducible whatever order the batches finish in.
+# ----------------------------------------------------------------------
+
+def encode(table, columns):
+    return table, tuple(columns), copy_text(rows(columns)).encode(), len(next(iter(columns.values())))
+
+def batch_seed(seed, offset):
+    return None if seed is None else seed + offset
+
+def user_batch(seed, now, first_id, count):
+    generator = SyntheticUsers(seed=batch_seed(seed, first_id), now=now)
+    users, demographics = generator.users(first_id, count)
+    return [encode("users", users),
+            encode("demographics", demographics),
+            encode("onboarding", generator.onboarding(users["id"])),
+            encode("user_status", generator.user_status(users["id"]))]
+
+def account_batch(seed, now, first_id, count, account_type, n_users):
+    generator = SyntheticUsers(seed=batch_seed(seed, first_id), now=now)
+    accounts = generator.accounts(first_id, count, account_type, 1, n_users)
+    batch = [encode("accounts", accounts)]
+    if account_type in CARD_ACCOUNT_TYPES:
+        batch.append(encode("card_info", generator.cards(accounts["id"])))
+    return batch
+
+def card_batch(seed, now, days, table, first_account_id, user_ids, account_types, per_account, amounts):
+    generator = SyntheticTransactions(seed=batch_seed(seed, first_account_id), now=now, days=days)
+    return [encode(table, generator.card(user_ids, account_types, per_account, amounts))]
+
+def internal_batch(seed, now, days, first_account_id, user_ids, count):
+    generator = SyntheticTransactions(seed=batch_seed(seed, first_account_id), now=now, days=days)
+    return [encode("transactions_internal", generator.internal(user_ids, count))]
+
+# ----------------------------------------------------------------------
+# Pipelines
+# ----------------------------------------------------------------------
+
+async def run_all(*coroutines):
+    """
+    Run coroutines concurrently like asyncio.gather, but cancel the others
+    as soon as one fails, then raise its error. A failed writer then can't
+    leave a producer blocked on a full queue while holding a pooled
+    connection, which would hang closing the pools.
+    """
+    tasks = [asyncio.ensure_future(coroutine) for coroutine in coroutines]
+    try:
+        return await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+
+async def pipeline(pool, work, executor, report, writers=WRITERS, queue_size=QUEUE_SIZE):
+    """
+    Run every (function, args) item of the async iterable `work` in the
+    process pool and COPY the resulting batches with `writers` concurrent
+    connections. At most queue_size batches wait for a writer, which bounds
+    both memory and how far generation runs ahead of the database.
+    """
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue(queue_size)
+
+    async def produce():
+        # Closing `work` releases any connection it streams from if we're cancelled.
+        async with aclosing(work):
+            async for function, args in work:
+                await queue.put(loop.run_in_executor(executor, function, *args))
+        for _ in range(writers):
+            await queue.put(None)
+
+    async def write():
+        async with pool.acquire() as conn:
+            while (future := await queue.get()) is not None:
+                batch = await future
+                async with conn.transaction():
+                    for table, columns, payload, count in batch:
+                        with report.track(table) as counter:
+                            await conn.copy_to_table(table, source=io.BytesIO(payload), columns=columns,
+                                                     format="text")
+                            counter["rows"] = count
+                            counter["bytes"] = len(payload)
+                report.commits += 1
+
+    await run_all(produce(), *(write() for _ in range(writers)))
+
+async def relay(source_conn, query, target_conn, table, columns, queue_size=QUEUE_SIZE):
+    """
+    Stream the result of query on one server into table on another with
+    COPY TO STDOUT / COPY FROM STDIN, passing the raw COPY data through a
+    bounded queue without decoding it. Returns (rows, bytes) copied.
+    """
+    queue = asyncio.Queue(queue_size)
+    sent = 0
+
+    async def read():
+        await source_conn.copy_from_query(query, output=queue.put, format="text")
+        await queue.put(None)
+
+    async def chunks():
+        nonlocal sent
+        while (data := await queue.get()) is not None:
+            sent += len(data)
+            yield data
+
+    _, status = await run_all(read(), target_conn.copy_to_table(table, source=chunks(), columns=columns,
+                                                                       format="text"))
+    return int(status.split()[-1]), sent
+
+async def account_chunks(pool, account_types, chunk_size):
+    """Yield lists of (id, user_id, account_type) records of the given types, in id order."""
+    async with pool.acquire() as conn, conn.transaction():
+        cursor = await conn.cursor(
+            "SELECT id, user_id, account_type FROM accounts WHERE account_type = ANY($1) ORDER BY id",
+            list(account_types))
+        while accounts := await cursor.fetch(chunk_size):
+            yield accounts
+
+# ----------------------------------------------------------------------
+# Loads
+# ----------------------------------------------------------------------
+
+async def load_users(pool, executor, report, options):
+    """Replace the users and their accounts in DB_CORE_USERS (ids assigned client-side, 1..N)."""
+    n_users, chunk_size, seed, now = options["users"], options["chunk_size"], options["seed"], options["now"]
+    async with pool.acquire() as conn:
+        await conn.execute("""
+            TRUNCATE TABLE card_info, accounts, user_status, onboarding, demographics, users
+            RESTART IDENTITY CASCADE;
+        """)
+
+    async def users():
+        for first_id in range(1, n_users + 1, chunk_size):
+            yield user_batch, (seed, now, first_id, min(chunk_size, n_users + 1 - first_id))
+
+    async def accounts():
+        next_account_id = 1
+        for account_type, remaining in account_counts(n_users):
+            while remaining:
+                count = min(chunk_size, remaining)
+                yield account_batch, (seed, now, next_account_id, count, account_type, n_users)
+                next_account_id += count
+                remaining -= count
+
+    # Accounts reference users, so every user batch is committed first.
+    await pipeline(pool, users(), executor, report, options["writers"], options["queue_size"])
+    await pipeline(pool, accounts(), executor, report, options["writers"], options["queue_size"])
+
+    async with pool.acquire() as conn:
+        for table in ("users", "accounts"):
+            await conn.execute(f"""
+                SELECT setval(pg_get_serial_sequence('{table}', 'id'), COALESCE(MAX(id), 1), MAX(id) IS NOT NULL)
+                FROM {table};
+            """)
+
+async def load_transactions(users_pool, trans_pool, executor, report, options):
+    """
+    Replace the transactions in DB_CORE_TRANSACTIONS with new ones for every
+    account in DB_CORE_USERS, then refresh operations and rollups and move
+    the accounts watermark, as core_transactions.py does without --append.
+    """
+    seed, now, days, per_account = options["seed"], options["now"], options["days"], options["per_account"]
+    accounts_per_chunk = max(2, options["chunk_size"] // per_account)
+
+    async with trans_pool.acquire() as conn:
+        await conn.execute("""
+            TRUNCATE TABLE transactions_mastercard, transactions_paypal, transactions_internal,
+                           operations, user_daily_rollups, refresh_watermarks
+            RESTART IDENTITY;
+        """)
+        await conn.fetchval("SELECT ensure_monthly_partitions($1, $2);", now - timedelta(days=days + 1), now)
+
+    async def work():
+        for table, account_types, amounts in (
+            ("transactions_mastercard", MASTERCARD_ACCOUNT_TYPES, MASTERCARD_AMOUNTS),
+            ("transactions_paypal", PAYPAL_ACCOUNT_TYPES, PAYPAL_AMOUNTS),
+        ):
+            async with aclosing(account_chunks(users_pool, account_types, accounts_per_chunk)) as chunks:
+                async for accounts in chunks:
+                    yield card_batch, (seed, now, days, table, accounts[0]["id"],
+                                       [acct["user_id"] for acct in accounts],
+                                       [acct["account_type"] for acct in accounts], per_account, amounts)
+        async with aclosing(account_chunks(users_pool, INTERNAL_ACCOUNT_TYPES, accounts_per_chunk)) as chunks:
+            async for accounts in chunks:
+                transfers = round(len(accounts) * INTERNAL_PER_SAVINGS_ACCOUNT * per_account)
+                if len(accounts) >= 2 and transfers:
+                    yield internal_batch, (seed, now, days, accounts[0]["id"],
+                                           [acct["user_id"] for acct in accounts], transfers)
+
+    await pipeline(trans_pool, work(), executor, report, options["writers"], options["queue_size"])
+
+    async with trans_pool.acquire() as conn:
+        with report.track("operations") as counter:
+            counter["rows"] = await conn.fetchval("SELECT refresh_operations();")
+            report.commits += 1
+        with report.track("user_daily_rollups") as counter:
+            counter["rows"] = await conn.fetchval("SELECT refresh_user_daily_rollups();")
+            report.commits += 1
+        # Every account loaded so far has its transactions; --append runs of
+        # core_transactions.py start above it.
+        last_account_id = await users_pool.fetchval("SELECT COALESCE(MAX(id), 0) FROM accounts;")
+        await conn.execute("""
+            INSERT INTO refresh_watermarks (consumer, source_table, last_id, refreshed_at)
+            VALUES ('transactions_loader', 'accounts', $1, now())
+            ON CONFLICT (consumer, source_table)
+            DO UPDATE SET last_id = EXCLUDED.last_id, refreshed_at = EXCLUDED.refreshed_at;
+        """, last_account_id)
+
+async def load_campaigns(users_pool, metas_pool, report, options):
+    """Replace the campaigns in DB_ML_METAS and assign them to eligible credit_card users."""
+    async with metas_pool.acquire() as conn:
+        await conn.execute("TRUNCATE TABLE user_campaigns, campaigns RESTART IDENTITY CASCADE;")
+        await conn.execute("""
+            CREATE TEMPORARY TABLE credit_card_users (
+                user_id INTEGER PRIMARY KEY,
+                activated_date DATE
+            ) ON COMMIT PRESERVE ROWS;
+        """)
+        try:
+            # Stage the credit_card users' activation dates straight from DB_CORE_USERS.
+            with report.track("credit_card_users") as counter:
+                async with users_pool.acquire() as users_conn:
+                    counter["rows"], counter["bytes"] = await relay(
+                        users_conn,
+                        """
+                        SELECT user_id, MIN(activated_at)::date
+                        FROM accounts
+                        WHERE account_type = 'credit_card'
+                        GROUP BY user_id
+                        """,
+                        conn, "credit_card_users", ("user_id", "activated_date"), options["queue_size"])
+                await conn.execute("CREATE INDEX ON credit_card_users (activated_date);")
+                await conn.execute("ANALYZE credit_card_users;")
+                report.commits += 1
+
+            with report.track("campaigns") as counter:
+                campaigns = generate_campaigns(options["campaigns"], options["seed"])
+                columns = ("name", "goal", "cashback_percentage", "start_date", "end_date")
+                payload = copy_text(campaigns).encode()
+                await conn.copy_to_table("campaigns", source=io.BytesIO(payload), columns=columns, format="text")
+                counter["rows"], counter["bytes"] = len(campaigns), len(payload)
+                report.commits += 1
+            campaign_ids = [row["id"] for row in await conn.fetch("SELECT id FROM campaigns ORDER BY id")]
+
+            per_batch = options["campaigns_per_batch"]
+            if options["seed"] is not None:
+                # Merchants are drawn with the server's random(); seed it as well.
+                await conn.execute("SELECT setseed($1);", (options["seed"] % 2**31) / 2**31)
+            for start in range(0, len(campaign_ids), per_batch):
+                with report.track("user_campaigns") as counter:
+                    status = await conn.execute(ASSIGN_CAMPAIGNS_SQL, MERCHANTS, len(MERCHANTS),
+                                                campaign_ids[start:start + per_batch])
+                    counter["rows"] = int(status.split()[-1])
+                    report.commits += 1
+        finally:
+            # The staging table lives as long as the pooled session; drop it.
+            await conn.execute("DROP TABLE IF EXISTS credit_card_users;")
+
+async def seed_all(options):
+    """Load core_users, then transactions and campaigns concurrently. Returns (report, phase timings)."""
+    report = LoadReport()
+    timings = {}
+    executor = ProcessPoolExecutor(options["processes"], mp_context=multiprocessing.get_context("spawn"))
+    users_pool, trans_pool, metas_pool = await asyncio.gather(
+        create_pool("core_users", bulk=True),
+        create_pool("core_transactions", bulk=True),
+        create_pool("ml_metas", bulk=True))
+    try:
+        started = time.perf_counter()
+        await load_users(users_pool, executor, report, options)
+        timings["core_users"] = time.perf_counter() - started
+
+        async def timed(name, load):
+            load_started = time.perf_counter()
+            await load
+            timings[name] = time.perf_counter() - load_started
+
+        await run_all(
+            timed("core_transactions", load_transactions(users_pool, trans_pool, executor, report, options)),
+            timed("ml_metas", load_campaigns(users_pool, metas_pool, report, options)))
+        timings["total"] = time.perf_counter() - started
+    finally:
+        await asyncio.gather(users_pool.close(), trans_pool.close(), metas_pool.close())
+        executor.shutdown()
+    return report, timings
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Seed all three databases concurrently: core_users first, then transactions and campaigns.")
+    parser.add_argument("--users", type=int, default=100,
+                        help="number of users to generate (default: 100)")
+    parser.add_argument("--per-account", type=int, default=1,
+                        help="card/paypal transactions per account; internal transfers scale with it (default: 1)")
+    parser.add_argument("--days", type=int, default=100,
+                        help="spread transaction timestamps over this many days before now (default: 100)")
+    parser.add_argument("--campaigns", type=int, default=50,
+                        help="number of campaigns to create (default: 50)")
+    parser.add_argument("--campaigns-per-batch", type=int, default=100,
+                        help="campaigns assigned per INSERT ... SELECT statement (default: 100)")
+    parser.add_argument("--chunk-size", type=int, default=COPY_CHUNK_ROWS,
+                        help="rows generated and copied per batch")
+    parser.add_argument("--writers", type=int, default=WRITERS,
+                        help=f"concurrent COPY connections per database (default: {WRITERS})")
+    parser.add_argument("--queue-size", type=int, default=QUEUE_SIZE,
+                        help=f"batches buffered between generation and the writers (default: {QUEUE_SIZE})")
+    parser.add_argument("--processes", type=int, default=os.cpu_count(),
+                        help="processes generating and encoding batches (default: CPU count)")
+    parser.add_argument("--seed", type=int, default=None,
+                        help="seed for the synthetic data generator (default: random)")
+    args = parser.parse_args()
+    if args.users < 1:
+        parser.error("--users must be at least 1")
+    if args.per_account < 1:
+        parser.error("--per-account must be at least 1")
+    if args.campaigns < 1:
+        parser.error("--campaigns must be at least 1")
+    if args.campaigns_per_batch < 1:
+        parser.error("--campaigns-per-batch must be at least 1")
+    if args.chunk_size < 1:
+        parser.error("--chunk-size must be at least 1")
+    return args
+
+def main():
+    args = parse_args()
+    options = vars(args)
+    # One shared "now" keeps every batch's time window identical.
+    options["now"] = datetime.now()
+
+    report, timings = asyncio.run(seed_all(options))
+
+    print(f"Seeding complete ({args.users} users) in {timings['total']:.2f} s: "
+          f"core_users {timings['core_users']:.2f} s, then concurrently "
+          f"core_transactions {timings['core_transactions']:.2f} s and ml_metas {timings['ml_metas']:.2f} s.")
+    report.print()
+
+if __name__ == '__main__':
+    main()
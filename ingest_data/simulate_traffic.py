@@ -0,0 +1,152 @@
+import argparse
+import json
+import time
+from datetime import datetime, timedelta
+
+import telemetry
+from bulk import LoadReport, copy_rows, percentile
+from core_transactions import ensure_partitions, refresh_operations
+from db import connection, read_connection, stream
+from rollups import refresh_rollups
+from synthetic import TRAFFIC_MIX, SyntheticTraffic, rows
+
+# Sustained write load for db_core_transactions: transactions with current
+# timestamps are written at a target rate, one COPY transaction per tick,
+# until the duration elapses (or Ctrl-C). Throughput and write latency are
+# printed every --report-every seconds.
+
+# Backlog (in seconds of traffic) carried over when the database falls
+# behind the target rate; anything older is dropped and counted.
+MAX_BACKLOG_SECONDS = 1.0
+
+def load_owners(conn):
+    """Return {account_type: [owner user_id of every account of that type]} from DB_CORE_USERS."""
+    owners = {account_type: [] for account_type, _ in TRAFFIC_MIX}
+    for chunk in stream(conn, "SELECT account_type, user_id FROM accounts WHERE account_type IN %s",
+                        (tuple(owners),)):
+        for account_type, user_id in chunk:
+            owners[account_type].append(user_id)
+    return owners
+
+def write_batch(conn, report, tables):
+    """COPY one tick's transactions in a single transaction. Returns the rows written."""
+    written = 0
+    with conn.cursor() as cur:
+        for table, columns in tables.items():
+            with report.track(table) as counter:
+                written += copy_rows(cur, table, columns.keys(), rows(columns), counter=counter)
+    report.commit(conn)
+    return written
+
+def simulate(traffic, rate, duration, tick, report_every, refresh_every):
+    """
+    Write `rate` transactions per second for `duration` seconds (0: until
+    interrupted). Every tick the transactions owed since the previous one
+    are generated with timestamps in between and written together. Returns
+    the LoadReport and a summary of the run.
+    """
+    report = LoadReport()
+    totals = {"written": 0, "dropped": 0, "refreshed": 0}
+    window = {"written": 0, "latencies": []}
+    owed = 0.0
+
+    with connection("core_transactions", bulk=True) as conn:
+        started = last = window_started = last_refresh = time.perf_counter()
+        last_timestamp = datetime.now()
+        ensure_partitions(conn, last_timestamp, last_timestamp + timedelta(days=1))
+        try:
+            while not duration or last - started < duration:
+                time.sleep(max(0.0, last + tick - time.perf_counter()))
+                now = time.perf_counter()
+                timestamp = datetime.now()
+
+                owed += rate * (now - last)
+                if owed > rate * MAX_BACKLOG_SECONDS:
+                    totals["dropped"] += int(owed - rate * MAX_BACKLOG_SECONDS)
+                    owed = rate * MAX_BACKLOG_SECONDS
+                count = int(owed)
+                owed -= count
+                last = now
+
+                if count:
+                    write_started = time.perf_counter()
+                    written = write_batch(conn, report, traffic.batch(count, last_timestamp, timestamp))
+                    window["latencies"].append(time.perf_counter() - write_started)
+                    window["written"] += written
+                    totals["written"] += written
+                last_timestamp = timestamp
+
+                if refresh_every and now - last_refresh >= refresh_every:
+                    with report.track("operations") as counter:
+                        counter["rows"] = refresh_operations(conn)
+                    totals["refreshed"] += counter["rows"]
+                    with report.track("user_daily_rollups") as counter:
+                        counter["rows"] = refresh_rollups(conn)
+                    last_refresh = now
+
+                if now - window_started >= report_every:
+                    elapsed = now - window_started
+                    print(f"{now - started:>8.1f} s  {window['written'] / elapsed:>10,.0f} tx/s "
+                          f"(target {rate:,})  write p50 {percentile(window['latencies'], 0.50) * 1000:>7.1f} ms  "
+                          f"p99 {percentile(window['latencies'], 0.99) * 1000:>7.1f} ms  "
+                          f"dropped {totals['dropped']:,}", flush=True)
+                    window = {"written": 0, "latencies": []}
+                    window_started = now
+                    # Long runs cross into new months.
+                    ensure_partitions(conn, timestamp, timestamp + timedelta(days=1))
+        except KeyboardInterrupt:
+            pass
+        elapsed = time.perf_counter() - started
+
+    summary = {
+        "target_rate": rate,
+        "seconds": round(elapsed, 3),
+        "written": totals["written"],
+        "achieved_rate": round(totals["written"] / elapsed, 1) if elapsed else 0.0,
+        "dropped": totals["dropped"],
+        "operations_refreshed": totals["refreshed"]
+    }
+    return report, summary
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Write transactions with current timestamps to db_core_transactions at a target rate.")
+    parser.add_argument("--rate", type=int, default=1000,
+                        help="target transactions per second (default: 1000)")
+    parser.add_argument("--duration", type=float, default=60,
+                        help="seconds to run; 0 runs until interrupted (default: 60)")
+    parser.add_argument("--tick", type=float, default=0.1,
+                        help="seconds between writes; each write is one COPY transaction (default: 0.1)")
+    parser.add_argument("--report-every", type=float, default=5,
+                        help="seconds between throughput/latency lines (default: 5)")
+    parser.add_argument("--refresh-every", type=float, default=0,
+                        help="also refresh operations and the daily rollups every this many seconds (default: never)")
+    parser.add_argument("--seed", type=int, default=None,
+                        help="seed for the synthetic traffic (default: random)")
+    parser.add_argument("--output", default=None,
+                        help="write the run summary and per-table report as JSON to this path")
+    telemetry.add_metrics_argument(parser)
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    with read_connection("core_users") as users_conn:
+        owners = load_owners(users_conn)
+    traffic = SyntheticTraffic(owners, seed=args.seed)
+    if not traffic.account_types:
+        raise SystemExit("No accounts to simulate traffic for; load core_users first.")
+
+    report, summary = simulate(traffic, args.rate, args.duration, args.tick, args.report_every, args.refresh_every)
+
+    print(f"{summary['written']:,} transactions in {summary['seconds']:.2f} s: "
+          f"{summary['achieved_rate']:,.0f} tx/s achieved for a target of {args.rate:,} tx/s "
+          f"({summary['dropped']:,} dropped behind schedule).")
+    report.print()
+    if args.metrics:
+        telemetry.write_metrics(args.metrics, telemetry.collect(report))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"summary": summary, "report": report.summary()}, f, indent=2)
+
+if __name__ == '__main__':
+    main()
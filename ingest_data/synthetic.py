@@ -0,0 +1,356 @@
+import numpy as np
+from datetime import datetime
+
+# Vectorized synthetic data for the core_users and core_transactions schemas.
+# Every method draws a whole chunk of rows at once from a seeded NumPy
+# generator and returns a dict of column arrays keyed by the table's column
+# names, so the loaders never call random.* per row.
+
+# Lists of common Chilean first names and surnames.
+male_first_names = [
+    "Juan", "Carlos", "Pedro", "Miguel", "Andrés",
+    "Jorge", "Ricardo", "Francisco", "Sebastián", "Diego"
+]
+female_first_names = [
+    "María", "Camila", "Sofía", "Isabella", "Valentina",
+    "Fernanda", "Catalina", "Gabriela", "Antonella", "Julieta"
+]
+last_names = [
+    "González", "Rodríguez", "Pérez", "Martínez", "Sánchez",
+    "Ramírez", "Torres", "Flores", "Díaz", "Reyes"
+]
+
+# Common email domains.
+email_domains = ["gmail.com", "hotmail.cl", "yahoo.com", "outlook.com"]
+
+# Chilean regions and cities (simplified). Demographics reference them by
+# region_id, their position + 1 (the ids seeded in db_core_users/init.sql).
+chile_locations = [
+    ("Región Metropolitana", "Santiago"),
+    ("Región de Valparaíso", "Valparaíso"),
+    ("Región del Biobío", "Concepción"),
+    ("Región de Coquimbo", "La Serena"),
+    ("Región de Antofagasta", "Antofagasta"),
+    ("Región de La Araucanía", "Temuco"),
+    ("Región de O'Higgins", "Rancagua"),
+    ("Región de Los Lagos", "Puerto Montt"),
+    ("Región de Magallanes", "Punta Arenas"),
+    ("Región de Tarapacá", "Iquique")
+]
+
+GENDERS = ["Male", "Female", "Other"]
+INCOME_LEVELS = ["Low", "Medium", "High"]
+
+# Accounts opened per user, by account type: 50 credit_card, 100 prepago,
+# 100 savings and 10 paypal accounts for every 100 users.
+ACCOUNT_MIX = [
+    ("credit_card", 0.5),
+    ("prepago", 1.0),
+    ("savings", 1.0),
+    ("paypal", 0.1)
+]
+
+# Account types that get a (masked) card_info row.
+CARD_ACCOUNT_TYPES = ("prepago", "credit_card")
+
+# Merchants card and paypal transactions are made at.
+MERCHANTS = ["Amazon", "Walmart", "BestBuy", "Target", "Starbucks"]
+
+# Amount ranges per transactions table.
+MASTERCARD_AMOUNTS = (10, 1000)
+PAYPAL_AMOUNTS = (5, 500)
+INTERNAL_AMOUNTS = (1, 300)
+
+# Internal transfers generated per savings account (50 per 100 accounts).
+INTERNAL_PER_SAVINGS_ACCOUNT = 0.5
+
+# Live traffic (simulate_traffic.py): share of transactions per account
+# type, merchant popularity (in MERCHANTS order), amount ranges and the share
+# of approved/completed transactions per account type.
+TRAFFIC_MIX = [
+    ("credit_card", 0.35),
+    ("prepago", 0.40),
+    ("paypal", 0.10),
+    ("savings", 0.15)
+]
+MERCHANT_WEIGHTS = [0.35, 0.25, 0.10, 0.12, 0.18]
+TRAFFIC_AMOUNTS = {
+    "credit_card": MASTERCARD_AMOUNTS,
+    "prepago": (5, 300),
+    "paypal": PAYPAL_AMOUNTS,
+    "savings": INTERNAL_AMOUNTS
+}
+APPROVAL_RATES = {
+    "credit_card": 0.92,
+    "prepago": 0.85,
+    "paypal": 0.95,
+    "savings": 0.97
+}
+
+# Accents stripped from names when building email usernames.
+ACCENTS = str.maketrans("áéíóúÁÉÍÓÚ", "aeiouAEIOU")
+
+def account_counts(n_users):
+    """Return [(account_type, count)] for n_users following ACCOUNT_MIX."""
+    return [(account_type, round(n_users * per_user)) for account_type, per_user in ACCOUNT_MIX]
+
+def rows(columns):
+    """
+    Turn a dict of column arrays into an iterator of row tuples made of plain
+    Python values (ints, floats, str, datetime, None) that psycopg2 and the
+    COPY writer understand.
+    """
+    return zip(*(col.tolist() if isinstance(col, np.ndarray) else col
+                 for col in columns.values()))
+
+class SyntheticUsers:
+    """
+    Seeded batch generator for users, demographics, onboarding, user_status,
+    accounts and card_info. All timestamps are relative to the moment the
+    generator was created, so chunks of one run are consistent.
+    """
+
+    def __init__(self, seed=None, now=None):
+        self.rng = np.random.default_rng(seed)
+        self.now = np.datetime64(now or datetime.now(), "us")
+
+        # First names are indexed 0-9 (male) and 10-19 (female); the full
+        # name and accent-free email username of every first/last combination
+        # are computed once instead of per row.
+        first_names = male_first_names + female_first_names
+        self.full_names = np.array([[f"{first} {last}" for last in last_names] for first in first_names])
+        self.usernames = np.array([[f"{first}.{last}".translate(ACCENTS).lower() for last in last_names]
+                                   for first in first_names])
+
+    def _days_ago(self, n, max_days):
+        """Timestamps now minus a whole number of days in [0, max_days]."""
+        days = self.rng.integers(0, max_days + 1, n)
+        return self.now - days.astype("timedelta64[D]")
+
+    def users(self, first_id, count):
+        """
+        Generate users first_id..first_id+count-1. Returns the column dicts
+        for (users, demographics). Emails embed the user id, so they are
+        unique for as long as the ids are.
+        """
+        rng = self.rng
+        ids = np.arange(first_id, first_id + count)
+
+        gender = rng.integers(0, len(GENDERS), count)
+        # Male -> male names, Female -> female names, Other -> either list.
+        first = np.where(gender == 0, rng.integers(0, 10, count),
+                         np.where(gender == 1, rng.integers(10, 20, count), rng.integers(0, 20, count)))
+        last = rng.integers(0, len(last_names), count)
+        domain = rng.integers(0, len(email_domains), count)
+        phone = rng.integers(0, 10 ** 8, count)
+        location = rng.integers(0, len(chile_locations), count)
+
+        emails = [f"{username}{user_id}@{email_domains[d]}"
+                  for username, user_id, d in zip(self.usernames[first, last].tolist(), ids.tolist(), domain.tolist())]
+        phones = [f"+56 9 {p // 10000:04d} {p % 10000:04d}" for p in phone.tolist()]
+
+        users = {
+            "id": ids,
+            "name": self.full_names[first, last],
+            "email": emails,
+            "phone": phones
+        }
+        demographics = {
+            "user_id": ids,
+            "age": rng.integers(18, 81, count),
+            "gender": np.array(GENDERS)[gender],
+            "income_level": np.array(INCOME_LEVELS)[rng.integers(0, len(INCOME_LEVELS), count)],
+            "region_id": location + 1
+        }
+        return users, demographics
+
+    def onboarding(self, user_ids):
+        """One onboarding row per user id: step 1-5, half completed."""
+        count = len(user_ids)
+        completed = self.rng.random(count) > 0.5
+        completed_at = np.where(self.rng.random(count) > 0.5, self.now, np.datetime64("NaT", "us"))
+        return {
+            "user_id": np.asarray(user_ids),
+            "step": self.rng.integers(1, 6, count),
+            "status": np.where(completed, "completed", "in_progress"),
+            "completed_at": completed_at
+        }
+
+    def user_status(self, user_ids):
+        """One active user_status row per user id, last seen within 30 days."""
+        count = len(user_ids)
+        minutes = (self.rng.integers(0, 31, count) * 1440
+                   + self.rng.integers(0, 24, count) * 60
+                   + self.rng.integers(0, 60, count))
+        return {
+            "user_id": np.asarray(user_ids),
+            "status": ["active"] * count,
+            "last_active_at": self.now - minutes.astype("timedelta64[m]")
+        }
+
+    def accounts(self, first_id, count, account_type, user_low, user_high):
+        """
+        Generate accounts first_id..first_id+count-1 of one type, each owned
+        by a user drawn uniformly from [user_low, user_high] and activated up
+        to 100 days ago.
+        """
+        return {
+            "id": np.arange(first_id, first_id + count),
+            "user_id": self.rng.integers(user_low, user_high + 1, count),
+            "account_type": [account_type] * count,
+            "balance": np.round(self.rng.uniform(0, 100000, count), 2),
+            "currency": ["CLP"] * count,
+            "activated_at": self._days_ago(count, 100)
+        }
+
+    def cards(self, account_ids):
+        """One masked, active card per account expiring in 1 to 5 years."""
+        count = len(account_ids)
+        years = self.rng.integers(1, 6, count)
+        expiration = (self.now + (years * 365).astype("timedelta64[D]")).astype("datetime64[D]")
+        return {
+            "account_id": np.asarray(account_ids),
+            "card_number": ["***"] * count,
+            "expiration_date": expiration,
+            "status": ["active"] * count
+        }
+
+class SyntheticTransactions:
+    """
+    Seeded batch generator for the transactions_* tables. Timestamps are
+    spread uniformly over the `days` days (to the minute) before the moment
+    the generator was created.
+    """
+
+    def __init__(self, seed=None, now=None, days=100):
+        self.rng = np.random.default_rng(seed)
+        self.now = np.datetime64(now or datetime.now(), "us")
+        self.window_minutes = days * 1440 + 23 * 60 + 59
+
+    def timestamps(self, count):
+        minutes = self.rng.integers(0, self.window_minutes + 1, count)
+        return self.now - minutes.astype("timedelta64[m]")
+
+    def amounts(self, count, low_high):
+        return np.round(self.rng.uniform(low_high[0], low_high[1], count), 2)
+
+    def card(self, user_ids, account_types, per_account, low_high):
+        """
+        Generate per_account card transactions for every account, given as
+        parallel user_id / account_type sequences. Used for both
+        transactions_mastercard and transactions_paypal.
+        """
+        user_ids = np.repeat(np.asarray(user_ids), per_account)
+        account_types = np.repeat(np.asarray(account_types), per_account)
+        count = len(user_ids)
+        return {
+            "user_id": user_ids,
+            "amount": self.amounts(count, low_high),
+            "merchant": np.array(MERCHANTS)[self.rng.integers(0, len(MERCHANTS), count)],
+            "account_type": account_types,
+            "timestamp": self.timestamps(count),
+            "status": np.where(self.rng.random(count) < 0.5, "approved", "declined")
+        }
+
+    def internal(self, user_ids, count):
+        """
+        Generate count transfers between distinct users drawn from user_ids
+        (the owners of savings accounts, see transfer_pairs). None are
+        generated unless there are at least two distinct owners.
+        """
+        senders, receivers = transfer_pairs(self.rng, user_ids, count)
+        count = len(senders)
+        return {
+            "sender_id": senders,
+            "receiver_id": receivers,
+            "amount": self.amounts(count, INTERNAL_AMOUNTS),
+            "account_type": ["savings"] * count,
+            "timestamp": self.timestamps(count),
+            "status": np.where(self.rng.random(count) < 0.5, "completed", "pending")
+        }
+
+def transfer_pairs(rng, owners, count):
+    """
+    Draw count (sender, receiver) pairs of distinct users from owners, which
+    lists the owner of every savings account, so users with more accounts
+    transfer more often. A user may own several accounts, so receivers that
+    came out equal to their sender are redrawn. Returns two arrays of user
+    ids, empty when owners has fewer than two distinct users.
+    """
+    owners = np.asarray(owners)
+    if len(np.unique(owners)) < 2:
+        return owners[:0], owners[:0]
+    senders = owners[rng.integers(0, len(owners), count)]
+    receivers = owners[rng.integers(0, len(owners), count)]
+    while (same := np.flatnonzero(receivers == senders)).size:
+        receivers[same] = owners[rng.integers(0, len(owners), same.size)]
+    return senders, receivers
+
+class SyntheticTraffic:
+    """
+    Seeded batch generator for live transactions: account types follow
+    TRAFFIC_MIX, merchants MERCHANT_WEIGHTS, and amounts are log-uniform
+    within TRAFFIC_AMOUNTS (small purchases are the most frequent).
+    `owners` maps each account type to an array with the owner of every
+    account of that type, so busier users (with more accounts) transact more.
+    """
+
+    def __init__(self, owners, seed=None):
+        self.rng = np.random.default_rng(seed)
+        # Internal transfers need two distinct savings owners.
+        self.owners = {account_type: np.asarray(user_ids) for account_type, user_ids in owners.items()
+                       if len(np.unique(user_ids)) >= (2 if account_type == "savings" else 1)}
+        mix = [(account_type, share) for account_type, share in TRAFFIC_MIX if account_type in self.owners]
+        self.account_types = [account_type for account_type, _ in mix]
+        self.shares = np.array([share for _, share in mix]) / sum(share for _, share in mix)
+
+    def amounts(self, count, low_high):
+        low, high = np.log(low_high[0]), np.log(low_high[1])
+        return np.round(np.exp(self.rng.uniform(low, high, count)), 2)
+
+    def statuses(self, count, account_type, ok, failed):
+        return np.where(self.rng.random(count) < APPROVAL_RATES[account_type], ok, failed)
+
+    def timestamps(self, count, start, end):
+        span = max(int((np.datetime64(end, "us") - np.datetime64(start, "us")).astype(np.int64)), 1)
+        return np.datetime64(start, "us") + self.rng.integers(0, span, count).astype("timedelta64[us]")
+
+    def batch(self, count, start, end):
+        """
+        Generate count transactions timestamped between start and end.
+        Returns {table: column dict} for the transactions_* tables that got rows.
+        """
+        per_type = self.rng.multinomial(count, self.shares)
+        card = {"user_id": [], "amount": [], "merchant": [], "account_type": [], "timestamp": [], "status": []}
+        tables = {}
+        for account_type, n in zip(self.account_types, per_type.tolist()):
+            if not n:
+                continue
+            owners = self.owners[account_type]
+            if account_type == "savings":
+                senders, receivers = transfer_pairs(self.rng, owners, n)
+                tables["transactions_internal"] = {
+                    "sender_id": senders,
+                    "receiver_id": receivers,
+                    "amount": self.amounts(n, TRAFFIC_AMOUNTS[account_type]),
+                    "account_type": ["savings"] * n,
+                    "timestamp": self.timestamps(n, start, end),
+                    "status": self.statuses(n, account_type, "completed", "pending")
+                }
+                continue
+            columns = {
+                "user_id": owners[self.rng.integers(0, len(owners), n)],
+                "amount": self.amounts(n, TRAFFIC_AMOUNTS[account_type]),
+                "merchant": np.array(MERCHANTS)[self.rng.choice(len(MERCHANTS), n, p=MERCHANT_WEIGHTS)],
+                "account_type": np.full(n, account_type),
+                "timestamp": self.timestamps(n, start, end),
+                "status": self.statuses(n, account_type, "approved", "declined")
+            }
+            if account_type == "paypal":
+                tables["transactions_paypal"] = columns
+            else:
+                for name, values in columns.items():
+                    card[name].append(values)
+        if card["user_id"]:
+            tables["transactions_mastercard"] = {name: np.concatenate(values) for name, values in card.items()}
+        return tables
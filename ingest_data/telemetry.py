@@ -0,0 +1,213 @@
+import json
+import os
+import re
+import threading
+import time
+
+import psycopg2.extensions
+
+# Client-side statement telemetry for the loaders. Every cursor opened on a
+# pooled connection (see IngestConnection in db.py) is an InstrumentedCursor,
+# which records per database and statement kind ("insert users", "copy
+# accounts", "select refresh_operations", "commit", ...) the number of calls,
+# errors, rows affected, total time and a latency histogram.
+#
+# Statistics are kept per process, like the connection pools. Worker
+# processes hand theirs to the parent through LoadReport.statements (see
+# drain()), and scripts write the combined snapshot with --metrics as JSON
+# or, for paths ending in .prom, in the Prometheus text format.
+#
+# correlate() puts these next to the same breakdown read from
+# pg_stat_statements (see pg_statements.py), so time spent on the wire or in
+# the client shows up as the difference between client and server time.
+
+# Upper bounds, in seconds, of the latency histogram buckets.
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# First table (or, for bare SELECTs, function) a statement works on.
+_VERB = re.compile(r"^\s*(\w+)")
+_TARGET = re.compile(r"\b(?:into|from|update|copy|table|lock|truncate|analyze|vacuum)\s+"
+                     r"(?:only\s+|table\s+|if\s+exists\s+)*([a-z_][\w.]*)", re.IGNORECASE)
+_FUNCTION = re.compile(r"^\s*select\s+([a-z_][\w.]*)\s*\(", re.IGNORECASE)
+_NAMED = re.compile(r"^\s*(?:prepare|execute|deallocate)\s+([a-z_]\w*)", re.IGNORECASE)
+
+# Statistics of each process, keyed by process id so a forked worker starts
+# empty instead of reporting its parent's statements again.
+_stats = {}
+_lock = threading.Lock()
+
+def statement_kind(sql):
+    """Classify a statement as "<verb> <table or function>", e.g. "insert users"."""
+    if isinstance(sql, bytes):
+        sql = sql.decode(errors="replace")
+    elif not isinstance(sql, str):
+        sql = str(sql)
+    verb = _VERB.match(sql)
+    if not verb:
+        return "other"
+    verb = verb.group(1).lower()
+    target = _NAMED.match(sql) or _TARGET.search(sql) or _FUNCTION.match(sql)
+    return f"{verb} {target.group(1).lower()}" if target else verb
+
+def _new_entry():
+    return {"calls": 0, "errors": 0, "rows": 0, "seconds": 0.0, "buckets": [0] * (len(LATENCY_BUCKETS) + 1)}
+
+def _bucket(seconds):
+    for index, bound in enumerate(LATENCY_BUCKETS):
+        if seconds <= bound:
+            return index
+    return len(LATENCY_BUCKETS)
+
+def observe(database, kind, seconds, rows=0, error=False):
+    """Record one statement (or commit) of this process."""
+    with _lock:
+        entry = _stats.setdefault(os.getpid(), {}).setdefault(database, {}).setdefault(kind, _new_entry())
+        entry["calls"] += 1
+        entry["errors"] += error
+        entry["rows"] += max(rows, 0)
+        entry["seconds"] += seconds
+        entry["buckets"][_bucket(seconds)] += 1
+
+def snapshot():
+    """Return a copy of this process's statistics: {database: {kind: entry}}."""
+    with _lock:
+        return merge({}, _stats.get(os.getpid(), {}))
+
+def drain():
+    """Return this process's statistics and start over (e.g. at the end of a worker's task)."""
+    with _lock:
+        return _stats.pop(os.getpid(), {})
+
+def merge(target, other):
+    """Add the statistics in other to target (both {database: {kind: entry}}). Returns target."""
+    for database, kinds in other.items():
+        for kind, other_entry in kinds.items():
+            entry = target.setdefault(database, {}).setdefault(kind, _new_entry())
+            for field in ("calls", "errors", "rows", "seconds"):
+                entry[field] += other_entry[field]
+            entry["buckets"] = [a + b for a, b in zip(entry["buckets"], other_entry["buckets"])]
+    return target
+
+def collect(*reports):
+    """This process's statistics plus those the workers returned in the given LoadReports."""
+    statistics = snapshot()
+    for report in reports:
+        merge(statistics, report.statements)
+    return statistics
+
+class InstrumentedCursor(psycopg2.extensions.cursor):
+    """psycopg2 cursor that times every statement it runs (and, if named, every fetch)."""
+
+    def _timed(self, sql, run):
+        kind = statement_kind(sql)
+        started = time.perf_counter()
+        try:
+            result = run()
+        except BaseException:
+            observe(self.connection.info.dbname, kind, time.perf_counter() - started, error=True)
+            raise
+        # Named cursors only DECLARE here; their rows are counted by fetchmany().
+        rows = 0 if self.name else self.rowcount
+        observe(self.connection.info.dbname, kind, time.perf_counter() - started, rows)
+        self._kind = kind
+        return result
+
+    def execute(self, query, vars=None):
+        return self._timed(query, lambda: super(InstrumentedCursor, self).execute(query, vars))
+
+    def executemany(self, query, vars_list):
+        return self._timed(query, lambda: super(InstrumentedCursor, self).executemany(query, vars_list))
+
+    def copy_expert(self, sql, file, size=8192):
+        return self._timed(sql, lambda: super(InstrumentedCursor, self).copy_expert(sql, file, size))
+
+    def fetchmany(self, size=None):
+        if not self.name:
+            return super().fetchmany(size) if size is not None else super().fetchmany()
+        started = time.perf_counter()
+        rows = super().fetchmany(size) if size is not None else super().fetchmany()
+        observe(self.connection.info.dbname, f"fetch {getattr(self, '_kind', 'other')}",
+                time.perf_counter() - started, len(rows))
+        return rows
+
+def correlate(client, server):
+    """
+    Join client statistics ({database: {kind: entry}}) with the results of
+    pg_statements.server_statements() ({database: [statement]}) by database
+    and statement kind. Returns rows sorted by client time, with
+    overhead_ms = client time - server time.
+    """
+    joined = []
+    for database in sorted(set(client) | set(server)):
+        server_kinds = {}
+        for statement in server.get(database) or ():
+            totals = server_kinds.setdefault(statement["statement"], {"calls": 0, "total_ms": 0.0})
+            totals["calls"] += statement["calls"]
+            totals["total_ms"] += statement["total_ms"]
+        for kind in sorted(set(client.get(database, {})) | set(server_kinds)):
+            entry = client.get(database, {}).get(kind, _new_entry())
+            server_entry = server_kinds.get(kind)
+            client_ms = entry["seconds"] * 1000
+            joined.append({
+                "database": database,
+                "statement": kind,
+                "client_calls": entry["calls"],
+                "client_ms": round(client_ms, 3),
+                "server_calls": server_entry["calls"] if server_entry else None,
+                "server_ms": round(server_entry["total_ms"], 3) if server_entry else None,
+                "overhead_ms": round(client_ms - server_entry["total_ms"], 3) if server_entry else None
+            })
+    return sorted(joined, key=lambda row: row["client_ms"], reverse=True)
+
+def _labels(**labels):
+    return ",".join(f'{name}="{value}"' for name, value in labels.items())
+
+def prometheus(statistics):
+    """Render statistics in the Prometheus text exposition format."""
+    lines = [
+        "# HELP ingest_statement_duration_seconds Client-side latency of the loaders' statements.",
+        "# TYPE ingest_statement_duration_seconds histogram"
+    ]
+    for database, kinds in sorted(statistics.items()):
+        for kind, entry in sorted(kinds.items()):
+            cumulative = 0
+            for bound, count in zip(LATENCY_BUCKETS + ("+Inf",), entry["buckets"]):
+                cumulative += count
+                lines.append(f"ingest_statement_duration_seconds_bucket"
+                             f"{{{_labels(database=database, statement=kind, le=bound)}}} {cumulative}")
+            labels = _labels(database=database, statement=kind)
+            lines.append(f"ingest_statement_duration_seconds_sum{{{labels}}} {entry['seconds']:.6f}")
+            lines.append(f"ingest_statement_duration_seconds_count{{{labels}}} {entry['calls']}")
+    for metric, field, text in (("ingest_statement_rows_total", "rows", "Rows affected or fetched."),
+                                ("ingest_statement_errors_total", "errors", "Statements that raised.")):
+        lines.append(f"# HELP {metric} {text}")
+        lines.append(f"# TYPE {metric} counter")
+        for database, kinds in sorted(statistics.items()):
+            for kind, entry in sorted(kinds.items()):
+                lines.append(f"{metric}{{{_labels(database=database, statement=kind)}}} {entry[field]}")
+    return "\n".join(lines) + "\n"
+
+def print_statements(statistics):
+    """Print calls, rows, total and mean time per database and statement kind, slowest first."""
+    rows = [(database, kind, entry) for database, kinds in statistics.items() for kind, entry in kinds.items()]
+    for database, kind, entry in sorted(rows, key=lambda row: row[2]["seconds"], reverse=True):
+        mean = entry["seconds"] / entry["calls"] * 1000 if entry["calls"] else 0.0
+        print(f"  {database:<18} {kind:<40} {entry['calls']:>9,} calls  {entry['rows']:>12,} rows  "
+              f"{entry['seconds']:>9.2f} s  mean {mean:>9.2f} ms"
+              + (f"  {entry['errors']:,} errors" if entry["errors"] else ""))
+
+def add_metrics_argument(parser):
+    """Add the --metrics option, whose value scripts pass to write_metrics(), to an argparse parser."""
+    parser.add_argument("--metrics", default=None,
+                        help="write per-statement timings to this path (.prom: Prometheus text, else JSON; -: print)")
+
+def write_metrics(path, statistics):
+    """Write statistics to path: Prometheus text for *.prom, JSON otherwise; "-" prints them."""
+    if path == "-":
+        print_statements(statistics)
+        return
+    with open(path, "w") as f:
+        if path.endswith(".prom"):
+            f.write(prometheus(statistics))
+        else:
+            json.dump({"buckets": LATENCY_BUCKETS, "statements": statistics}, f, indent=2)
@@ -0,0 +1,3 @@
+-- Extensions shared by every database. pg_stat_statements also has to be in
+-- shared_preload_libraries (see profiles/common.conf).
+CREATE EXTENSION IF NOT EXISTS pg_stat_statements;
@@ -0,0 +1,12 @@
+#!/bin/sh
+# Let the streaming standbys (docker-compose "replicas" profile) clone and
+# follow this server: a role allowed to replicate, and a pg_hba.conf rule
+# accepting its replication connections from any host.
+set -e
+
+psql -v ON_ERROR_STOP=1 --username "$POSTGRES_USER" --dbname "$POSTGRES_DB" \
+     -v user="$REPLICATION_USER" -v password="$REPLICATION_PASSWORD" <<'EOSQL'
+CREATE ROLE :"user" WITH REPLICATION LOGIN PASSWORD :'password';
+EOSQL
+
+echo "host replication $REPLICATION_USER all scram-sha-256" >> "$PGDATA/pg_hba.conf"
@@ -0,0 +1,35 @@
+#!/bin/sh
+# Entrypoint of the streaming standbys (docker-compose "replicas" profile).
+# On first start the data directory is cloned from $PRIMARY_HOST with
+# pg_basebackup through the replication slot $REPLICATION_SLOT (created on
+# the primary unless it exists) and set up to follow the primary (-R). The
+# server then starts through tuned-entrypoint.sh like the primaries, in hot
+# standby: it serves read-only queries while replaying the primary's WAL.
+set -e
+
+if [ "$1" = "postgres" ] && [ ! -s "$PGDATA/PG_VERSION" ]; then
+    export PGHOST="$PRIMARY_HOST" PGPORT="${PRIMARY_PORT:-5432}" PGUSER="$REPLICATION_USER" PGPASSWORD="$REPLICATION_PASSWORD"
+    until pg_isready -q; do
+        echo "Waiting for $PRIMARY_HOST to accept connections..."
+        sleep 1
+    done
+
+    slot=$(psql -d postgres -tAc "SELECT 1 FROM pg_replication_slots WHERE slot_name = '$REPLICATION_SLOT'")
+    create_slot=--create-slot
+    [ -n "$slot" ] && create_slot=
+
+    mkdir -p "$PGDATA"
+    chmod 700 "$PGDATA"
+    as_postgres=
+    if [ "$(id -u)" = "0" ]; then
+        chown postgres:postgres "$PGDATA"
+        as_postgres="gosu postgres"
+    fi
+    $as_postgres pg_basebackup -D "$PGDATA" -X stream -R -S "$REPLICATION_SLOT" $create_slot --checkpoint=fast
+fi
+
+if [ "$1" = "postgres" ]; then
+    # Don't let long analytics reads be cancelled by vacuum on the primary.
+    set -- "$@" -c hot_standby_feedback=on -c max_standby_streaming_delay=30s
+fi
+exec tuned-entrypoint.sh "$@"
@@ -0,0 +1,18 @@
+#!/bin/sh
+# Start the official entrypoint with the settings of the tuning profile named
+# by POSTGRES_PROFILE (profiles/<name>.conf, after profiles/common.conf)
+# passed as -c options, which take precedence over postgresql.conf in the
+# data directory. Values must not contain spaces.
+set -e
+
+profiles=/etc/postgresql/profiles
+if [ "$1" = "postgres" ]; then
+    if [ ! -f "$profiles/$POSTGRES_PROFILE.conf" ]; then
+        echo "Unknown tuning profile '$POSTGRES_PROFILE'; available: $(cd $profiles && ls *.conf | sed 's/\.conf$//' | tr '\n' ' ')" >&2
+        exit 1
+    fi
+    set -- "$@" $(cat "$profiles/common.conf" "$profiles/$POSTGRES_PROFILE.conf" \
+        | sed -e 's/#.*//' -e 's/[[:space:]]*=[[:space:]]*/=/' -e "s/'//g" -e 's/[[:space:]]*$//' \
+        | grep '=' | sed 's/^/-c /')
+fi
+exec docker-entrypoint.sh "$@"